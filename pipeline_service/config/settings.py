@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -17,6 +17,12 @@ class Settings(BaseSettings):
     qwen_gpu: int = Field(default=0, env="QWEN_GPU")
     trellis_gpu: int = Field(default=0, env="TRELLIS_GPU")
     dtype: str = Field(default="bf16", env="QWEN_DTYPE")
+    cuda_alloc_conf: Optional[str] = Field(default="expandable_segments:True,max_split_size_mb:512,garbage_collection_threshold:0.8", env="CUDA_ALLOC_CONF")
+    gpu_memory_fraction: Optional[float] = Field(default=None, env="GPU_MEMORY_FRACTION") # Opt-in hard per-process cap, peaks above it raise OOM
+    shrink_gpu_between_requests: bool = Field(default=False, env="SHRINK_GPU_BETWEEN_REQUESTS")
+    deterministic: bool = Field(default=False, env="DETERMINISTIC") # Deterministic cuDNN kernels instead of autotuned ones
+    allow_tf32: bool = Field(default=True, env="ALLOW_TF32") # TF32 tensor cores for the remaining float32 matmuls and convolutions
+    empty_cache_debug: bool = Field(default=False, env="EMPTY_CACHE_DEBUG") # Leak hunting only, flushes the cache after every request
 
     # Hugging Face settings
     hf_token: Optional[str] = Field(default=None, env="HF_TOKEN")
@@ -24,7 +30,9 @@ class Settings(BaseSettings):
     # Generated files settings
     save_generated_files: bool = Field(default=False, env="SAVE_GENERATED_FILES")
     send_generated_files: bool = Field(default=False, env="SEND_GENERATED_FILES")
+    response_image_format: Literal["PNG", "WEBP", "JPEG"] = Field(default="PNG", env="RESPONSE_IMAGE_FORMAT")
     output_dir: Path = Field(default=Path("generated_outputs"), env="OUTPUT_DIR")
+    save_workers: int = Field(default=4, env="SAVE_WORKERS")
 
     # Trellis settings
     trellis_model_id: str = Field(default="jetx/trellis-image-large", env="TRELLIS_MODEL_ID")
@@ -33,6 +41,10 @@ class Settings(BaseSettings):
     trellis_slat_steps: int = Field(default=20, env="TRELLIS_SLAT_STEPS")
     trellis_slat_cfg_strength: float = Field(default=2.4, env="TRELLIS_SLAT_CFG_STRENGTH")
     trellis_num_oversamples: int = Field(default=4, env="TRELLIS_NUM_OVERSAMPLES")
+    trellis_use_fp16: bool = Field(default=True, env="TRELLIS_USE_FP16")
+    trellis_cuda_graphs: bool = Field(default=False, env="TRELLIS_CUDA_GRAPHS")
+    trellis_compile: bool = Field(default=False, env="TRELLIS_COMPILE")
+    trellis_compile_mode: str = Field(default="default", env="TRELLIS_COMPILE_MODE")
     compression: bool = Field(default=False, env="COMPRESSION")
 
     # Qwen Edit settings
@@ -44,6 +56,10 @@ class Settings(BaseSettings):
     true_cfg_scale: float = Field(default=1.0, env="TRUE_CFG_SCALE")
     qwen_edit_prompt_path: Path = Field(default=config_dir.joinpath("qwen_edit_prompt.json"), env="QWEN_EDIT_PROMPT_PATH")
     use_original_as_primary: bool = Field(default=False, env="USE_ORIGINAL_AS_PRIMARY")
+    validate_views: bool = Field(default=False, env="VALIDATE_VIEWS") # Advisory view consistency check, only logged
+    fast_preprocess: bool = Field(default=True, env="FAST_PREPROCESS") # False runs the reference PIL enhancement chain, bit-exact with earlier outputs
+    qwen_prompt_cache_size: int = Field(default=0, env="QWEN_PROMPT_CACHE_SIZE") # Keyed on the condition image too, only hits when the same image is edited again
+    qwen_attention_backend: Optional[str] = Field(default=None, env="QWEN_ATTENTION_BACKEND") # e.g. "flash", "_flash_3"; None keeps native SDPA
 
     # Backgorund removal settings
     background_removal_model_id: str = Field(default="tuandao-zenai/rm_bg", env="BACKGROUND_REMOVAL_MODEL_ID")
@@ -51,6 +67,12 @@ class Settings(BaseSettings):
     output_image_size: tuple[int, int] = Field(default=(518, 518), env="OUTPUT_IMAGE_SIZE") # (height, width)
     padding_percentage: float = Field(default=0.2, env="PADDING_PERCENTAGE")
     limit_padding: bool = Field(default=True, env="LIMIT_PADDING")
+    rmbg_dtype: str = Field(default="fp16", env="RMBG_DTYPE") # fp32 / bf16 / fp16
+    rmbg_channels_last: bool = Field(default=True, env="RMBG_CHANNELS_LAST")
+    warmup_image_size: tuple[int, int] = Field(default=(1024, 1024), env="WARMUP_IMAGE_SIZE") # (height, width)
+    rmbg_batch_all_views: bool = Field(default=False, env="RMBG_BATCH_ALL_VIEWS") # One forward for the 4 views instead of overlapping the primary one with the edits
+    skip_rmbg_if_prompt_removes_bg: bool = Field(default=False, env="SKIP_RMBG_IF_PROMPT_REMOVES_BG")
+    uniform_background_max_std: float = Field(default=12.0, env="UNIFORM_BACKGROUND_MAX_STD")
 
     class Config:
         env_file = ".env"
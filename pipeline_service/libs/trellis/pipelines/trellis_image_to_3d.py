@@ -24,6 +24,9 @@ class TrellisImageTo3DPipeline(Pipeline):
         image_cond_model (str): The name of the image conditioning model.
     """
 
+    # Autocast dtype for the image conditioning model (float32 disables autocast)
+    image_cond_dtype: torch.dtype = torch.float32
+
     def __init__(
         self,
         models: dict[str, nn.Module] = None,
@@ -142,15 +145,23 @@ class TrellisImageTo3DPipeline(Pipeline):
                 "Image list should be list of PIL images"
             )
             image = [i.resize((518, 518), Image.Resampling.LANCZOS) for i in image]
-            image = [np.array(i.convert("RGB")).astype(np.float32) / 255 for i in image]
-            image = [torch.from_numpy(i).permute(2, 0, 1).float() for i in image]
-            image = torch.stack(image).to(self.device)
+            # Upload uint8 from pinned memory and convert to float on the device
+            image = torch.from_numpy(np.stack([np.asarray(i.convert("RGB")) for i in image]))
+            if self.device.type == "cuda":
+                image = image.pin_memory()
+            image = image.to(self.device, non_blocking=True)
+            image = image.permute(0, 3, 1, 2).to(torch.float32, memory_format=torch.contiguous_format).div_(255)
         else:
             raise ValueError(f"Unsupported type of image: {type(image)}")
 
         image = self.image_cond_model_transform(image).to(self.device)
-        features = self.models["image_cond_model"](image, is_training=True)["x_prenorm"]
-        patchtokens = F.layer_norm(features, features.shape[-1:])
+        with torch.autocast(
+            device_type=self.device.type,
+            dtype=self.image_cond_dtype,
+            enabled=self.image_cond_dtype != torch.float32,
+        ):
+            features = self.models["image_cond_model"](image, is_training=True)["x_prenorm"]
+        patchtokens = F.layer_norm(features.float(), features.shape[-1:])
         return patchtokens
 
     def get_cond(self, image: Union[torch.Tensor, list[Image.Image]]) -> dict:
@@ -1,15 +1,17 @@
 from __future__ import annotations
 
+import threading
 import time
 import numpy as np
 import torch
-from PIL import Image
+from PIL import Image, ImageStat
 from transformers import AutoModelForImageSegmentation
 from torchvision import transforms
 from torchvision.transforms.functional import to_pil_image, resized_crop
 
 from config import Settings
 from logger_config import logger
+from modules.utils import resolve_dtype
 
 
 class BackgroundRemovalService:
@@ -26,17 +28,14 @@ class BackgroundRemovalService:
 
         # Set device
         self.device = f"cuda:{settings.qwen_gpu}" if torch.cuda.is_available() else "cpu"
+        self.dtype = resolve_dtype(settings.rmbg_dtype)
 
-        # Set model
+        # Set model, forwards from worker threads are serialized
         self.model: AutoModelForImageSegmentation | None = None
+        self._lock = threading.Lock()
 
-        # Set transform
-        self.transforms = transforms.Compose(
-            [
-                transforms.Resize(self.settings.input_image_size), 
-                transforms.ToTensor(),
-            ]
-        )
+        # Set transform, the tensor conversion happens on the device (see _to_device_tensor)
+        self.transforms = transforms.Resize(self.settings.input_image_size)
 
         # Set normalize
         self.normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
@@ -51,10 +50,13 @@ class BackgroundRemovalService:
         try:
             self.model = AutoModelForImageSegmentation.from_pretrained(
                 self.settings.background_removal_model_id,
-                torch_dtype=torch.float32,
+                torch_dtype=self.dtype,
                 trust_remote_code=True,
             ).to(self.device)
-            logger.success(f"{self.settings.background_removal_model_id} model loaded.")
+            if self.settings.rmbg_channels_last:
+                # NHWC matches the tensor core layout of the convolutions
+                self.model = self.model.to(memory_format=torch.channels_last)
+            logger.success(f"{self.settings.background_removal_model_id} model loaded with dtype={self.dtype}.")
         except Exception as e:
             logger.error(f"Error loading {self.settings.background_removal_model_id} model: {e}")
             raise RuntimeError(f"Error loading {self.settings.background_removal_model_id} model: {e}")
@@ -73,57 +75,137 @@ class BackgroundRemovalService:
         if self.model is None:
             raise RuntimeError(f"{self.settings.background_removal_model_id} model not initialized.")
 
+    def _has_alpha(self, image: Image.Image) -> bool:
+        """
+        Check if the image already carries a meaningful alpha channel.
+        """
+        if image.mode != "RGBA":
+            return False
+        alpha = np.array(image)[:, :, 3]
+        return not np.all(alpha == 255)
+
+    def has_uniform_background(self, image: Image.Image, border: int = 8) -> bool:
+        """
+        Check if the image border is a solid color, i.e. the background was already replaced.
+        """
+        width, height = image.size
+        strips = [
+            image.crop((0, 0, width, border)),
+            image.crop((0, height - border, width, height)),
+            image.crop((0, 0, border, height)),
+            image.crop((width - border, 0, width, height)),
+        ]
+        return all(
+            max(ImageStat.Stat(strip.convert("RGB")).stddev) <= self.settings.uniform_background_max_std
+            for strip in strips
+        )
+
+    def remove_uniform_background(self, image: Image.Image, low: float = 20.0, high: float = 40.0) -> Image.Image:
+        """
+        Cheap CPU alternative to the model for images on a solid background: mask the pixels that differ
+        from the border color, then blacken and crop like remove_background does.
+        """
+        t1 = time.time()
+        rgb = np.asarray(image.convert("RGB"), dtype=np.float32)
+
+        # Background color is the mean of the border pixels
+        border_pixels = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+        distance = np.abs(rgb - border_pixels.mean(axis=0)).max(axis=-1)
+        # Soft mask ramping from low to high color distance
+        mask = np.clip((distance - low) / (high - low), 0.0, 1.0)
+
+        height, width = mask.shape
+        ys, xs = np.nonzero(mask > 0.8)
+        if len(ys) == 0:
+            top, left, bottom, right = 0, 0, height, width
+        else:
+            center_y, center_x = (ys.max() + ys.min()) / 2, (xs.max() + xs.min()) / 2
+            size = int(max(xs.max() - xs.min(), ys.max() - ys.min()) * (1 + self.padding_percentage))
+            top, left = int(center_y - size // 2), int(center_x - size // 2)
+            bottom, right = int(center_y + size // 2), int(center_x + size // 2)
+
+            if self.limit_padding:
+                top, left = max(0, top), max(0, left)
+                bottom, right = min(height, bottom), min(width, right)
+
+        foreground = Image.fromarray((rgb * mask[..., None]).astype(np.uint8))
+        # PIL pads out of bounds crops with black, as the blackened background
+        output = foreground.crop((left, top, right, bottom)).resize(self.output_size[::-1], Image.Resampling.BILINEAR)
+
+        logger.success(f"Uniform background remove - Time: {time.time() - t1:.2f}s - OutputSize: {output.size} - InputSize: {image.size}")
+        return output
+
     def remove_background(self, image: Image.Image) -> Image.Image:
         """
         Remove the background from the image.
         """
+        return self.remove_background_batch([image])[0]
+
+    def remove_background_batch(self, images: list[Image.Image]) -> list[Image.Image]:
+        """
+        Remove the background from several images with a single model forward.
+        """
         try:
             t1 = time.time()
-            # Check if the image has alpha channel
-            has_alpha = False
-            
-            if image.mode == "RGBA":
-                # Get alpha channel
-                alpha = np.array(image)[:, :, 3]
-                if not np.all(alpha==255):
-                    has_alpha=True
-            
-            if has_alpha:
-                # If the image has alpha channel, return the image
-                output = image
-                
-            else:
-                # PIL.Image (H, W, C) C=3
-                rgb_image = image.convert('RGB')
-                
-                # Tensor (H, W, C) -> (C, H',W')
-                rgb_tensor = self.transforms(rgb_image).to(self.device)
-                output = self._remove_background(rgb_tensor)
-
-                image_without_background = to_pil_image(output[:3])
+            outputs: list[Image.Image] = list(images)
+
+            # Images that already have an alpha channel are returned as is
+            pending = [i for i, image in enumerate(images) if not self._has_alpha(image)]
+
+            if pending:
+                # PIL.Image (H, W, C) C=3 -> Tensor (N, C, H', W')
+                rgb_tensors = self._to_device_tensor(
+                    [self.transforms(images[i].convert('RGB')) for i in pending]
+                )
+                with self._lock:
+                    masks = self._predict_masks(rgb_tensors)
+
+                for i, rgb_tensor, mask in zip(pending, rgb_tensors, masks):
+                    output = self._crop_foreground(rgb_tensor, mask)
+                    outputs[i] = to_pil_image(output[:3])
 
             removal_time = time.time() - t1
-            logger.success(f"Background remove - Time: {removal_time:.2f}s - OutputSize: {image_without_background.size} - InputSize: {image.size}")
+            logger.success(f"Background remove - Time: {removal_time:.2f}s - Images: {len(images)} - OutputSize: {outputs[0].size} - InputSize: {images[0].size}")
+
+            return outputs
 
-            return image_without_background
-            
         except Exception as e:
             logger.error(f"Error removing background: {e}")
-            return image 
+            return list(images)
 
-    def _remove_background(self, image_tensor: torch.Tensor) -> torch.Tensor:
+    def _to_device_tensor(self, images: list[Image.Image]) -> torch.Tensor:
         """
-        Remove the background from the image.
+        Upload resized images as uint8 from pinned memory and scale them to [0, 1] on the device.
+        """
+        # (N, H, W, C) uint8 is a quarter of the float32 bytes ToTensor would upload
+        host_tensor = torch.from_numpy(np.stack([np.asarray(image) for image in images]))
+        if self.device.startswith("cuda"):
+            host_tensor = host_tensor.pin_memory()
+
+        device_tensor = host_tensor.to(self.device, non_blocking=True)
+        # (N, H, W, C) -> (N, C, H, W), the permuted upload already is channels_last in memory
+        memory_format = torch.channels_last if self.settings.rmbg_channels_last else torch.contiguous_format
+        return device_tensor.permute(0, 3, 1, 2).to(torch.float32, memory_format=memory_format).div_(255)
+
+    def _predict_masks(self, image_tensors: torch.Tensor) -> torch.Tensor:
         """
-        # Normalize tensor value for background removal model, reshape for model batch processing (C=3, H, W) -> (1, C=3, H, W)
-        input_tensor = self.normalize(image_tensor).unsqueeze(0)
-                
+        Predict the foreground masks for a batch of images.
+        """
+        # Normalize tensor value for background removal model: (N, C=3, H, W), in float32 then cast to the model dtype
+        input_tensor = self.normalize(image_tensors).to(self.dtype)
+
         with torch.no_grad():
-            # Get mask from model (1, 1, H, W)
-            preds = self.model(input_tensor)[-1].sigmoid()
-            # Reshape and quantize mask values: (1, 1, H, W) -> (1, H, W) -> (H, W)
-            mask = preds[0].squeeze().mul_(255).int().div(255).float()
+            # Get masks from model (N, 1, H, W)
+            preds = self.model(input_tensor)[-1].float().sigmoid()
+            # Reshape and quantize mask values: (N, 1, H, W) -> (N, H, W)
+            masks = preds[:, 0].mul_(255).int().div(255).float()
 
+        return masks
+
+    def _crop_foreground(self, image_tensor: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+        """
+        Blacken the background and crop the image around the foreground mask.
+        """
         # Get bounding box indices
         bbox_indices = torch.argwhere(mask > 0.8)
         if len(bbox_indices) == 0:
@@ -154,9 +236,8 @@ class BackgroundRemovalService:
                 width=right - left
             )
 
-            mask = mask.unsqueeze(0)
-            # Concat mask with image and blacken the background: (C=3, H, W) | (1, H, W) -> (C=4, H, W)
-            tensor_rgba = torch.cat([image_tensor*mask, mask], dim=-3)
-            output = resized_crop(tensor_rgba, **crop_args, size = self.output_size, antialias=False)
-            return output
-
+        mask = mask.unsqueeze(0)
+        # Concat mask with image and blacken the background: (C=3, H, W) | (1, H, W) -> (C=4, H, W)
+        tensor_rgba = torch.cat([image_tensor*mask, mask], dim=-3)
+        output = resized_crop(tensor_rgba, **crop_args, size = self.output_size, antialias=False)
+        return output
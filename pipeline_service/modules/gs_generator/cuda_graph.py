@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+from logger_config import logger
+
+
+@dataclass(slots=True)
+class CapturedGraph:
+    """CUDA graph with the static tensors it reads from and writes to."""
+    graph: torch.cuda.CUDAGraph
+    inputs: tuple[torch.Tensor, ...]
+    output: torch.Tensor
+
+
+class CUDAGraphedModel(nn.Module):
+    """
+    Wraps a dense model and replays a CUDA graph per input shape instead of relaunching every kernel.
+
+    Graphs are captured lazily on the first call with a new shape (the startup warmup covers the
+    production shapes) and share one memory pool to keep the peak memory bounded.
+    Attribute lookups not found on the wrapper fall through to the wrapped model.
+    """
+
+    def __init__(self, model: nn.Module, max_graphs: int = 8, warmup_iters: int = 2):
+        super().__init__()
+        self.model = model
+        self.max_graphs = max_graphs
+        self.warmup_iters = warmup_iters
+        self._pool = None
+        self._graphs: dict[tuple, Optional[CapturedGraph]] = {}
+
+    def __getattr__(self, name: str):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.model, name)
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        if torch.is_grad_enabled() or not all(x.is_cuda for x in inputs):
+            return self.model(*inputs)
+
+        key = tuple((tuple(x.shape), x.dtype) for x in inputs)
+        if key not in self._graphs:
+            if len(self._graphs) >= self.max_graphs:
+                return self.model(*inputs)
+            self._graphs[key] = self._capture(inputs)
+
+        captured = self._graphs[key]
+        if captured is None:
+            # Capture failed for this shape, stay eager
+            return self.model(*inputs)
+
+        for static_input, x in zip(captured.inputs, inputs):
+            static_input.copy_(x)
+        captured.graph.replay()
+
+        # The output buffer is overwritten by the next replay
+        return captured.output.clone()
+
+    def _capture(self, inputs: tuple[torch.Tensor, ...]) -> Optional[CapturedGraph]:
+        """Capture the model forward for the shapes of the given inputs."""
+        try:
+            if self._pool is None:
+                self._pool = torch.cuda.graph_pool_handle()
+
+            static_inputs = tuple(x.clone() for x in inputs)
+
+            # Warm up on a side stream so lazy initializations are not recorded in the graph
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(self.warmup_iters):
+                    self.model(*static_inputs)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, pool=self._pool):
+                static_output = self.model(*static_inputs)
+
+            logger.info(f"Captured CUDA graph for {type(self.model).__name__} with input shapes {[tuple(x.shape) for x in inputs]}")
+            return CapturedGraph(graph=graph, inputs=static_inputs, output=static_output)
+
+        except Exception as e:
+            logger.warning(f"CUDA graph capture failed for {type(self.model).__name__}: {e}, running eagerly")
+            return None
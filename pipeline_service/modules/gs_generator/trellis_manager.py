@@ -1,19 +1,31 @@
 from __future__ import annotations
 
-import base64
 import os
+import threading
 import time
-from pathlib import Path
 from typing import Optional
 import io
 
+import numpy as np
+import pyspz
 import torch
-from PIL import Image, ImageStat
+from PIL import Image
 
 from config import Settings
 from logger_config import logger
+
+# Trellis picks its attention / sparse conv backends when its modules are imported
+os.environ.setdefault("ATTN_BACKEND", "flash_attn")
+os.environ.setdefault("SPCONV_ALGO", "native")
+
 from libs.trellis.pipelines import TrellisImageTo3DPipeline
 from schemas import TrellisResult, TrellisRequest, TrellisParams
+from modules.gs_generator.cuda_graph import CUDAGraphedModel
+
+# Resolution of the DINOv2 image conditioning input
+CONDITION_IMAGE_SIZE = 518
+# Views per request: primary, left, right, back
+MAX_VIEWS = 4
 
 class TrellisService:
     def __init__(self, settings: Settings):
@@ -22,10 +34,12 @@ class TrellisService:
         self.gpu = settings.trellis_gpu
         self.default_params = TrellisParams.from_settings(self.settings)
 
+        # Pinned view staging buffer reused across requests
+        self._staging: Optional[torch.Tensor] = None
+        self._lock = threading.Lock()
+
     async def startup(self) -> None:
         logger.info("Loading Trellis pipeline...")
-        os.environ.setdefault("ATTN_BACKEND", "flash-attn")
-        os.environ.setdefault("SPCONV_ALGO", "native")
 
         if torch.cuda.is_available():
             torch.cuda.set_device(self.gpu)
@@ -34,8 +48,89 @@ class TrellisService:
             self.settings.trellis_model_id
         )
         self.pipeline.cuda()
+        self._set_precision()
+        self._compile_models()
+        self._enable_cuda_graphs()
+
+        if torch.cuda.is_available():
+            self._staging = self._allocate_staging(MAX_VIEWS)
         logger.success("Trellis pipeline ready.")
 
+    def _allocate_staging(self, num_views: int) -> torch.Tensor:
+        """Allocate the pinned (N, H, W, C) uint8 host buffer the views are uploaded from."""
+        return torch.empty(
+            (num_views, CONDITION_IMAGE_SIZE, CONDITION_IMAGE_SIZE, 3), dtype=torch.uint8, pin_memory=True
+        )
+
+    def _stage_views(self, images: list[Image.Image]) -> torch.Tensor | list[Image.Image]:
+        """
+        Upload the views as one (N, 3, H, W) float tensor through the pinned staging buffer.
+        Views not at the conditioning resolution keep the PIL path, where Trellis resizes them.
+        """
+        size = (CONDITION_IMAGE_SIZE, CONDITION_IMAGE_SIZE)
+        if self._staging is None or any(image.size != size for image in images):
+            return images
+
+        if self._staging.shape[0] < len(images):
+            self._staging = self._allocate_staging(len(images))
+
+        staging = self._staging[:len(images)]
+        host = staging.numpy()
+        for i, image in enumerate(images):
+            host[i] = np.asarray(image)
+
+        # Safe to reuse on the next request: the copy is ordered before the pipeline's compute and results are read back
+        views = staging.to(self.pipeline.device, non_blocking=True)
+        return views.permute(0, 3, 1, 2).to(torch.float32, memory_format=torch.contiguous_format).div_(255)
+
+    def _enable_cuda_graphs(self) -> None:
+        """
+        Replay the sparse structure flow model from CUDA graphs.
+        Only the dense model has fixed shapes; the SLAT flow model runs on a variable number of voxels.
+        """
+        if not self.settings.trellis_cuda_graphs or not torch.cuda.is_available():
+            return
+
+        model = self.pipeline.models["sparse_structure_flow_model"]
+        self.pipeline.models["sparse_structure_flow_model"] = CUDAGraphedModel(model)
+        logger.info("CUDA graphs enabled for the sparse structure flow model.")
+
+    def _compile_models(self) -> None:
+        """
+        Compile the dense sparse structure models with torch.compile, the startup warmup triggers the compilation.
+        The SLAT flow model and the Gaussian decoder run on sparse tensors with a variable number of voxels
+        and would recompile on every request, so they stay eager.
+        The compiled flow model can still be captured by the CUDA graph wrapper, which clones its outputs,
+        whereas mode="reduce-overhead" would overwrite the conditional prediction with the CFG one.
+        """
+        if not self.settings.trellis_compile:
+            return
+
+        for name in ("sparse_structure_flow_model", "sparse_structure_decoder"):
+            model = self.pipeline.models.get(name)
+            if model is not None:
+                self.pipeline.models[name] = torch.compile(model, mode=self.settings.trellis_compile_mode, dynamic=False)
+
+        logger.info(f"Trellis sparse structure models compiled with mode={self.settings.trellis_compile_mode}.")
+
+    def _set_precision(self) -> None:
+        """
+        Run the flow transformers and the image conditioning model in float16.
+        Decoders keep the precision from their checkpoint config.
+        """
+        if not self.settings.trellis_use_fp16:
+            return
+
+        for name in ("sparse_structure_flow_model", "slat_flow_model"):
+            model = self.pipeline.models.get(name)
+            if model is not None and not model.use_fp16:
+                model.convert_to_fp16()
+                model.use_fp16 = True
+                model.dtype = torch.float16
+
+        self.pipeline.image_cond_dtype = torch.float16
+        logger.info("Trellis flow models and image conditioning running in float16.")
+
     async def shutdown(self) -> None:
         self.pipeline = None
         logger.info("Trellis pipeline closed.")
@@ -50,16 +145,19 @@ class TrellisService:
         if not self.pipeline:
             raise RuntimeError("Trellis pipeline not loaded.")
 
-        images_rgb = [image.convert("RGB") for image in trellis_request.images]
+        # RMBG already returns RGB views, only copy the ones that are not
+        images_rgb = [image if image.mode == "RGB" else image.convert("RGB") for image in trellis_request.images]
         logger.info(f"Generating Trellis {trellis_request.seed=} and image size {trellis_request.images[0].size}")
 
         params = self.default_params.overrided(trellis_request.params)
 
-        start = time.time()
-        try:
+        # The pipeline and the shared PLY buffer are not re-entrant
+        with self._lock:
+            start = time.time()
+
             # Generate with voxel-aware texture steps
             outputs, num_voxels = self.pipeline.run_multi_image_with_voxel_count(
-                images_rgb,
+                self._stage_views(images_rgb),
                 seed=trellis_request.seed,
                 sparse_structure_sampler_params={
                     "steps": params.sparse_structure_steps,
@@ -78,18 +176,19 @@ class TrellisService:
             generation_time = time.time() - start
             gaussian = outputs["gaussian"][0]
 
-            # Save ply to buffer
+            # Save ply to a per-call buffer; getvalue() hands over the buffer's bytes without copying
             buffer = io.BytesIO()
             gaussian.save_ply(buffer)
-            buffer.seek(0)
 
-            result = TrellisResult(
-                ply_file=buffer.getvalue() if buffer else None # bytes
-            )
+            if trellis_request.format == "spz":
+                result = TrellisResult(
+                    spz_file=pyspz.compress(buffer.getvalue(), workers=1) # bytes
+                )
+                logger.info(f"Compressed PLY to SPZ: {buffer.tell()} -> {len(result.spz_file)} bytes")
+            else:
+                result = TrellisResult(
+                    ply_file=buffer.getvalue() # bytes
+                )
 
             logger.success(f"Trellis finished generation in {generation_time:.2f}s with {num_voxels} occupied voxels.")
             return result
-        finally:
-            if buffer:
-                buffer.close()
-
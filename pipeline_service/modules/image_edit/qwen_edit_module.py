@@ -1,11 +1,14 @@
 import math
+from collections import OrderedDict
 from os import PathLike
 from pathlib import Path
 from typing import Optional, Any, Literal
 from safetensors import safe_open
 import torch
+import torch.nn.functional as F
 from pydantic import BaseModel, Field
 from diffusers import QwenImageEditPlusPipeline
+from diffusers.pipelines.qwenimage.pipeline_qwenimage_edit_plus import CONDITION_IMAGE_SIZE, calculate_dimensions
 import time
 from PIL import Image
 
@@ -34,6 +37,22 @@ class TextPrompting(BaseModel):
 class QwenEditModule(QwenManager):
     """Qwen module for image editing operations."""
 
+    # Shared instance handed out by get_or_create
+    _instance: Optional["QwenEditModule"] = None
+
+    @classmethod
+    def get_or_create(cls, settings: Settings) -> "QwenEditModule":
+        """
+        Return the shared module for these settings, creating it on first use or when the settings change.
+        Together with the idempotent startup, repeated callers in one process load the pipeline only once.
+        """
+        if cls._instance is None or cls._instance.settings != settings:
+            if cls._instance is not None:
+                # Free the previous pipeline first, the new one may not fit next to it
+                cls._instance.unload()
+            cls._instance = cls(settings)
+        return cls._instance
+
     def __init__(self, settings: Settings):
         super().__init__(settings)
         self._empty_image = Image.new('RGB', (1024, 1024))
@@ -43,6 +62,10 @@ class QwenEditModule(QwenManager):
         self.prompt_path = settings.qwen_edit_prompt_path
         self.prompting = self._set_prompting()
 
+        # Encoded prompts keyed by (prompt, condition image digest), Qwen2.5-VL conditions the text on the image
+        self._prompt_cache: OrderedDict[tuple[str, str], tuple[torch.Tensor, torch.Tensor]] = OrderedDict()
+        self._prompt_cache_size = settings.qwen_prompt_cache_size
+
         self.pipe_config = {
             "num_inference_steps": settings.num_inference_steps,
             "true_cfg_scale": settings.true_cfg_scale,
@@ -51,6 +74,12 @@ class QwenEditModule(QwenManager):
 
         }
 
+    def unload(self) -> None:
+        """Drop the cached prompt embeddings along with the pipeline, both live on the GPU."""
+        with self._lock:
+            self._prompt_cache.clear()
+        super().unload()
+
     def _set_text_prompting(self, path: Optional[PathLike] = None) -> TextPrompting:
         path = path or self.prompt_path
         with open(path, "r") as f:
@@ -117,33 +146,110 @@ class QwenEditModule(QwenManager):
 
         return image.resize((width, height), Image.Resampling.LANCZOS)
 
-    def _run_model_pipe(self, seed: Optional[int] = None, **kwargs):
+    def _run_model_pipe(self, seed: Optional[int] = None, num_images: int = 1, **kwargs):
         if seed:
-            kwargs.update(dict(generator=torch.Generator(device=self.device).manual_seed(seed)))
+            # One generator per batch item so each image gets the same noise as a single-image run
+            generators = [torch.Generator(device=self.device).manual_seed(seed) for _ in range(num_images)]
+            kwargs.update(dict(generator=generators if num_images > 1 else generators[0]))
         image = kwargs.pop("image", self._empty_image)
-        result = self.pipe(
-                image=image,
-                **self.pipe_config,
-                **kwargs)
+        with self._lock, torch.inference_mode():
+            result = self.pipe(
+                    image=image,
+                    **self.pipe_config,
+                    **kwargs)
         return result
     
     def _run_edit_pipe(self,
                        prompt_image: Image.Image,
                        seed: Optional[int] = None,
                        **kwargs):
-        prompt_image = self._prepare_input_image(prompt_image)
+        """Run the pipe on an image already resized by _prepare_input_image."""
         logger.info(f"Prompt image size: {prompt_image.size}")
-        logger.info(f"Prompt image: {kwargs}")
+        logger.info(f"Prompt: {kwargs.get('prompt', '<embeddings>')}")
         return self._run_model_pipe(seed=seed, image=prompt_image, **kwargs)
-    
-    
-    def edit_image(self, prompt_image: Image.Image, seed: int, prompt: Optional[str] = None):
+
+    def _encode_prompt(self, prompt: str, condition_image: Image.Image, image_digest: str) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Encode a prompt against the condition image, reusing the cached embeddings for a known pair.
+        """
+        key = (prompt, image_digest)
+        with self._lock:
+            if self._prompt_cache_size > 0 and key in self._prompt_cache:
+                self._prompt_cache.move_to_end(key)
+                return self._prompt_cache[key]
+
+            with torch.inference_mode():
+                prompt_embeds, prompt_embeds_mask = self.pipe.encode_prompt(
+                    prompt=prompt,
+                    image=[condition_image],
+                    device=self.device,
+                )
+            if prompt_embeds_mask is None:
+                prompt_embeds_mask = torch.ones(prompt_embeds.shape[:2], dtype=torch.long, device=prompt_embeds.device)
+            encoded = (prompt_embeds[0], prompt_embeds_mask[0])
+
+            if self._prompt_cache_size > 0:
+                self._prompt_cache[key] = encoded
+                if len(self._prompt_cache) > self._prompt_cache_size:
+                    self._prompt_cache.popitem(last=False)
+            return encoded
+
+    def _encode_prompt_batch(self, prompts: list[str], prompt_image: Image.Image) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Encode prompts against the same condition image and pad them into one batch.
+
+        The edit pipeline cannot tokenize a list of prompts for a single image, so each
+        prompt is encoded separately and zero-padded the same way the pipeline pads lists.
+        """
+        width, height = calculate_dimensions(CONDITION_IMAGE_SIZE, prompt_image.width / prompt_image.height)
+        condition_image = self.pipe.image_processor.resize(prompt_image, height, width)
+        # Hashing a fresh upload on every request only pays off when the cache is enabled
+        image_digest = hashlib.blake2b(condition_image.tobytes(), digest_size=16).hexdigest() if self._prompt_cache_size > 0 else ""
+
+        embeds, masks = [], []
+        for prompt in prompts:
+            prompt_embeds, prompt_embeds_mask = self._encode_prompt(prompt, condition_image, image_digest)
+            embeds.append(prompt_embeds)
+            masks.append(prompt_embeds_mask)
+
+        max_len = max(embed.shape[0] for embed in embeds)
+        prompt_embeds = torch.stack([F.pad(embed, (0, 0, 0, max_len - embed.shape[0])) for embed in embeds])
+        prompt_embeds_mask = torch.stack([F.pad(mask, (0, max_len - mask.shape[0])) for mask in masks])
+        return prompt_embeds, prompt_embeds_mask
+
+    def _get_prompt_kwargs(self, prompt_image: Image.Image, prompts: list[str]) -> dict[str, torch.Tensor]:
+        """
+        Build the (negative) prompt embedding kwargs of the pipe for a prepared image.
+        """
+        prompt_embeds, prompt_embeds_mask = self._encode_prompt_batch(prompts, prompt_image)
+        kwargs = dict(prompt_embeds=prompt_embeds, prompt_embeds_mask=prompt_embeds_mask)
+
+        negative_prompt = getattr(self.prompting, "negative_prompt", None)
+        if negative_prompt and self.pipe_config["true_cfg_scale"] > 1:
+            negative_embeds, negative_embeds_mask = self._encode_prompt_batch([negative_prompt], prompt_image)
+            kwargs.update(
+                negative_prompt_embeds=negative_embeds.expand(len(prompts), -1, -1),
+                negative_prompt_embeds_mask=negative_embeds_mask.expand(len(prompts), -1),
+            )
+        return kwargs
+
+    def edit_image(
+        self,
+        prompt_image: Image.Image,
+        seed: int,
+        prompt: Optional[str] = None,
+        prompt_embeds: Optional[torch.Tensor] = None,
+        prompt_embeds_mask: Optional[torch.Tensor] = None,
+    ):
         """ 
         Edit the image using Qwen Edit.
 
         Args:
             prompt_image: The prompt image to edit.
-            reference_image: The reference image to edit.
+            seed: The seed of the edit.
+            prompt: Optional prompt replacing the configured one.
+            prompt_embeds: Optional precomputed prompt embeddings, used instead of any prompt.
+            prompt_embeds_mask: Mask of the precomputed prompt embeddings.
 
         Returns:
             The edited image.
@@ -155,10 +261,16 @@ class QwenEditModule(QwenManager):
         try:
             start_time = time.time()
 
-            prompting = self.prompting.model_dump()
-            if prompt:
-                prompting["prompt"] = prompt
-            
+            prompt_image = self._prepare_input_image(prompt_image)
+
+            if prompt_embeds is not None:
+                prompting = dict(prompt_embeds=prompt_embeds, prompt_embeds_mask=prompt_embeds_mask)
+            elif isinstance(self.prompting, TextPrompting):
+                # Encode through the prompt cache instead of letting the pipe encode the text
+                prompting = self._get_prompt_kwargs(prompt_image, [prompt or self.prompting.prompt])
+            else:
+                prompting = self.prompting.model_dump()
+
             # Run the edit pipe
             result = self._run_edit_pipe(prompt_image=prompt_image,
                                          **prompting,
@@ -174,4 +286,43 @@ class QwenEditModule(QwenManager):
             
         except Exception as e:
             logger.error(f"Error generating image: {e}")
-            raise e
\ No newline at end of file
+            raise e
+
+    def edit_image_batch(self, prompt_image: Image.Image, seed: int, prompts: list[str]) -> list[Image.Image]:
+        """
+        Edit the same image with several prompts in a single diffusion batch.
+
+        Args:
+            prompt_image: The prompt image to edit.
+            seed: Seed shared by every edited image.
+            prompts: One prompt per edited image.
+
+        Returns:
+            The edited images, in the same order as the prompts.
+        """
+        if self.pipe is None:
+            logger.error("Edit Model is not loaded")
+            raise RuntimeError("Edit Model is not loaded")
+
+        try:
+            start_time = time.time()
+
+            prompt_image = self._prepare_input_image(prompt_image)
+            kwargs = self._get_prompt_kwargs(prompt_image, prompts)
+
+            result = self._run_model_pipe(seed=seed,
+                                          num_images=len(prompts),
+                                          image=prompt_image,
+                                          **kwargs)
+
+            generation_time = time.time() - start_time
+
+            images_edited = list(result.images)
+
+            logger.success(f"Edited {len(images_edited)} images generated in {generation_time:.2f}s, Size: {images_edited[0].size}, Seed: {seed}")
+
+            return images_edited
+
+        except Exception as e:
+            logger.error(f"Error generating images: {e}")
+            raise e
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import gc
 import hashlib
+import threading
 import time
 from dataclasses import dataclass
 from typing import Optional
@@ -15,6 +17,7 @@ from PIL import Image
 
 from config import Settings
 from logger_config import logger
+from modules.utils import resolve_dtype
 
 
 @dataclass(slots=True)
@@ -32,23 +35,37 @@ class QwenManager:
         self.device = f"cuda:{settings.qwen_gpu}" if torch.cuda.is_available() else "cpu"
         self.dtype = self._resolve_dtype(settings.dtype)
         self.gpu_index = settings.qwen_gpu
+        # The pipe keeps per-call state (scheduler timesteps, prompt cache), calls from worker threads are serialized
+        self._lock = threading.RLock()
 
     async def startup(self) -> None:
-        """Initialize the Qwen pipeline."""
+        """Initialize the Qwen pipeline, a no-op when it is already loaded."""
+        if self.pipe is not None:
+            logger.info("QwenManager already initialized.")
+            return
+
         logger.info("Initializing QwenManager...")
         await self._load_pipeline()
         logger.success("QwenManager ready.")
 
     async def shutdown(self) -> None:
         """Shutdown the pipeline and free resources."""
-        if self.pipe:
-            try:
-                self.pipe.to("cpu")
-            except Exception:
-                pass
-        self.pipe = None
+        self.unload()
         logger.info("QwenEditManager closed.")
 
+    def unload(self) -> None:
+        """Move the pipeline off the GPU, drop it and return its cached memory to the driver."""
+        with self._lock:
+            if self.pipe:
+                try:
+                    self.pipe.to("cpu")
+                except Exception:
+                    pass
+            self.pipe = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
     def is_ready(self) -> bool:
         """Check if pipeline is loaded and ready."""
         return self.pipe is not None
@@ -74,24 +91,32 @@ class QwenManager:
         )
         # Move model pipe to device
         self.pipe = self.pipe.to(self.device)
+        # The per-step tqdm updates are serialized CPU work between the denoising steps
+        self.pipe.set_progress_bar_config(disable=True)
+
+        self._configure_attention()
 
         load_time = time.time() - t1
 
         logger.success(f"Qwen pipeline ready (loading: {load_time:.2f}s). Loaded on {self.device} with dtype={self.dtype}.")
 
+    def _configure_attention(self) -> None:
+        """Make sure attention dispatches to the fused SDPA / FlashAttention kernels."""
+        if torch.cuda.is_available():
+            torch.backends.cuda.enable_flash_sdp(True)
+            torch.backends.cuda.enable_mem_efficient_sdp(True)
+
+        backend = self.settings.qwen_attention_backend
+        if backend:
+            try:
+                self.pipe.transformer.set_attention_backend(backend)
+            except Exception as err:
+                logger.warning(f"Failed to set attention backend '{backend}': {err}")
+
+        logger.info(f"Attention backend: {backend or 'native'} (flash SDPA enabled: {torch.backends.cuda.flash_sdp_enabled()})")
+
     def _resolve_dtype(self, dtype: str) -> torch.dtype:
-        mapping = {
-            "bf16": torch.bfloat16,
-            "bfloat16": torch.bfloat16,
-            "fp16": torch.float16,
-            "float16": torch.float16,
-            "fp32": torch.float32,
-            "float32": torch.float32,
-        }
-        resolved = mapping.get(dtype.lower(), torch.bfloat16)
-        if not torch.cuda.is_available() and resolved in {torch.float16, torch.bfloat16}:
-            return torch.float32
-        return resolved
+        return resolve_dtype(dtype)
 
     def _derive_seed(self, prompt: str) -> int:
         hash_object = hashlib.md5(prompt.encode("utf-8"))
@@ -1,15 +1,16 @@
 from __future__ import annotations
 
-import base64
-import io
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 import time
-from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from PIL import Image
-import pyspz
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
 import torch
+import torch.nn.functional as F
 import gc
+import cv2
 import numpy as np
 
 from config import Settings, settings
@@ -17,10 +18,9 @@ from logger_config import logger
 from schemas import (
     GenerateRequest,
     GenerateResponse,
-    TrellisParams,
     TrellisRequest,
-    TrellisResult,
 )
+from schemas.trellis_schemas import TrellisParamsOverrides
 from modules.image_edit.qwen_edit_module import QwenEditModule
 from modules.background_removal.rmbg_manager import BackgroundRemovalService
 from modules.gs_generator.trellis_manager import TrellisService
@@ -28,24 +28,73 @@ from modules.utils import (
     secure_randint,
     set_random_seed,
     decode_image,
-    to_png_base64,
+    decode_image_bytes,
+    to_b64,
     save_files,
+    save_trellis_result,
+)
+
+
+# PIL ImageFilter.SMOOTH kernel, used as the degenerate image of ImageEnhance.Sharpness
+SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+# ITU-R 601-2 luma transform used by PIL's convert("L")
+LUMINANCE_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# Min/max exchanges leaving the median of 9 values at index 4 (Paeth's median-of-9 network)
+MEDIAN9_NETWORK = (
+    (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8), (0, 3),
+    (5, 8), (4, 7), (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2),
 )
 
 
 class GenerationPipeline:
+    # Qwen-Edit prompt keeping the input viewpoint for the primary view
+    PRIMARY_VIEW_PROMPT = "Preserve exact colors, shapes, and all details. Only improve image quality and remove background with neutral solid color. Keep the same viewing angle"
+    # Complementary views with 3D rotation (around vertical Y-axis), in Trellis view order: left, right, back
+    # Left/right three-quarters views - 45° rotation, back view - 180° rotation around vertical axis (Y-axis)
+    VIEW_PROMPTS = (
+        "Rotate object 45 degrees counterclockwise around vertical axis (Y-axis) to show left three-quarter view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
+        "Rotate object 45 degrees clockwise around vertical axis (Y-axis) to show right three-quarter view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
+        "Rotate object 180 degrees around vertical axis (Y-axis) to show back view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
+    )
+
+    # Fraction of the allowed GPU memory above which the allocator reclaims cached blocks when shrinking is enabled
+    SHRINK_GC_THRESHOLD = 0.6
+
     def __init__(self, settings: Settings = settings):
         self.settings = settings
 
+        # Must be set before the first CUDA allocation to configure the caching allocator
+        if settings.cuda_alloc_conf:
+            os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", settings.cuda_alloc_conf)
+
         # Initialize modules
         self.qwen_edit = QwenEditModule(settings)
         self.rmbg = BackgroundRemovalService(settings)
         self.trellis = TrellisService(settings)
 
+        # Dedicated workers saving generated files, so saves never hold up the pipeline's own worker threads
+        self._save_executor = ThreadPoolExecutor(max_workers=settings.save_workers, thread_name_prefix="save")
+
+        # One generation at a time: requests share the GPU memory budget and the process-wide seed
+        self._generation_lock = asyncio.Lock()
+
+        # Pinned host buffer the image enhancement uploads from, grown to the largest input seen
+        self._enhance_staging: Optional[torch.Tensor] = None
+
+        # CUDA streams letting background removal overlap with the Qwen edits, created at startup
+        self._edit_stream: Optional[torch.cuda.Stream] = None
+        self._rmbg_stream: Optional[torch.cuda.Stream] = None
+
     async def startup(self) -> None:
         """Initialize all pipeline components."""
         logger.info("Starting pipeline")
         self.settings.output_dir.mkdir(parents=True, exist_ok=True)
+        self._limit_gpu_memory()
+        self._configure_backends()
+
+        if torch.cuda.is_available():
+            self._edit_stream = torch.cuda.Stream(device=self.qwen_edit.device)
+            self._rmbg_stream = torch.cuda.Stream(device=self.rmbg.device)
 
         await self.qwen_edit.startup()
         await self.rmbg.startup()
@@ -53,7 +102,7 @@ class GenerationPipeline:
 
         logger.info("Warming up generator...")
         await self.warmup_generator()
-        self._clean_gpu_memory()
+        self._enable_opportunistic_shrink()
 
         logger.success("Warmup is complete. Pipeline ready to work.")
 
@@ -61,6 +110,9 @@ class GenerationPipeline:
         """Shutdown all pipeline components."""
         logger.info("Closing pipeline")
 
+        # Let pending file saves finish
+        await asyncio.to_thread(self._save_executor.shutdown, wait=True)
+
         # Shutdown all modules
         await self.qwen_edit.shutdown()
         await self.rmbg.shutdown()
@@ -68,16 +120,147 @@ class GenerationPipeline:
 
         logger.info("Pipeline closed.")
 
-    def _clean_gpu_memory(self) -> None:
+    @property
+    def _draft_size(self) -> tuple[int, int]:
+        """
+        Smallest (width, height) inputs can be decoded at, the largest size the views are resized to.
+        """
+        height, width = self.settings.input_image_size
+        return max(width, self.settings.qwen_edit_width), max(height, self.settings.qwen_edit_height)
+
+    def _configure_backends(self) -> None:
+        """
+        Configure cuDNN and the float32 matmul precision once for the process lifetime.
+        Benchmark mode picks and caches the fastest algorithm per shape, deterministic mode trades it for reproducibility.
+        """
+        torch.backends.cudnn.deterministic = self.settings.deterministic
+        torch.backends.cudnn.benchmark = not self.settings.deterministic
+        logger.info(f"cuDNN deterministic={torch.backends.cudnn.deterministic} benchmark={torch.backends.cudnn.benchmark}")
+
+        if self.settings.allow_tf32:
+            torch.set_float32_matmul_precision("high")
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            logger.info("TF32 enabled for float32 matmuls and convolutions")
+
+    def _limit_gpu_memory(self) -> None:
         """
-        Clean the GPU memory.
+        Cap the caching allocator so it garbage-collects cached blocks instead of growing unbounded.
+        The allocator only applies garbage_collection_threshold once a memory fraction is set, so without
+        GPU_MEMORY_FRACTION a fraction of 1.0 turns the garbage collection on without capping the memory.
+        """
+        if not torch.cuda.is_available():
+            return
+
+        fraction = self.settings.gpu_memory_fraction
+        if not fraction and (self.settings.shrink_gpu_between_requests or self._configured_gc_threshold() < 1.0):
+            fraction = 1.0
+        if not fraction:
+            return
+
+        for gpu in {self.settings.qwen_gpu, self.settings.trellis_gpu}:
+            torch.cuda.set_per_process_memory_fraction(fraction, device=gpu)
+        logger.info(f"GPU memory fraction: {fraction}")
+
+    def _enable_opportunistic_shrink(self) -> None:
+        """
+        Let the caching allocator release cached blocks on its own when close to the memory cap
+        (GPU_MEMORY_FRACTION, the whole GPU when unset, see _limit_gpu_memory).
+        Unlike emptying the cache after every request, this keeps the warmed up pool in the hot path.
+        """
+        if not self.settings.shrink_gpu_between_requests or not torch.cuda.is_available():
+            return
+
+        # A lower threshold reclaims sooner, so never raise the one already configured in PYTORCH_CUDA_ALLOC_CONF
+        threshold = min(self.SHRINK_GC_THRESHOLD, self._configured_gc_threshold())
+        try:
+            torch.cuda.memory._set_allocator_settings(f"garbage_collection_threshold:{threshold}")
+            logger.info(f"Enabled opportunistic GPU memory shrinking (garbage_collection_threshold={threshold})")
+        except Exception as e:
+            logger.warning(f"Failed to configure the CUDA allocator: {e}")
+
+    @staticmethod
+    def _configured_gc_threshold() -> float:
+        """
+        Garbage collection threshold set through PYTORCH_CUDA_ALLOC_CONF, 1.0 when none is configured.
+        """
+        for option in os.environ.get("PYTORCH_CUDA_ALLOC_CONF", "").split(","):
+            key, _, value = option.partition(":")
+            if key.strip() == "garbage_collection_threshold":
+                try:
+                    return float(value)
+                except ValueError:
+                    break
+        return 1.0
+
+    def shrink(self) -> None:
+        """
+        Release all cached GPU memory back to the driver.
+        Only meant for when the GPU has to be shared with another engine, the next request pays the re-allocation.
         """
         gc.collect()
-        torch.cuda.empty_cache()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _debug_gpu_memory(self) -> None:
+        """
+        Flush the caching allocator and log what stays allocated, to spot memory leaking between requests.
+        """
+        if not self.settings.empty_cache_debug or not torch.cuda.is_available():
+            return
+
+        self.shrink()
+        for gpu in {self.settings.qwen_gpu, self.settings.trellis_gpu}:
+            allocated = torch.cuda.memory_allocated(gpu) / 2**20
+            reserved = torch.cuda.memory_reserved(gpu) / 2**20
+            logger.debug(f"GPU {gpu} memory after request: allocated={allocated:.0f}MB reserved={reserved:.0f}MB")
     
+    def _remove_primary_background(self, image: Image.Image, cleaned_by_prompt: bool) -> Image.Image:
+        """
+        Remove the background of the primary view on the RMBG stream.
+        """
+        with torch.cuda.stream(self._rmbg_stream):
+            if cleaned_by_prompt and self.rmbg.has_uniform_background(image):
+                # Qwen-Edit already replaced the background, skip the segmentation model
+                return self.rmbg.remove_uniform_background(image)
+            return self.rmbg.remove_background(image)
+
+    def _remove_views_background(self, images: list[Image.Image]) -> list[Image.Image]:
+        """
+        Remove the background of several views in one batch on the RMBG stream.
+        """
+        with torch.cuda.stream(self._rmbg_stream):
+            return self.rmbg.remove_background_batch(images)
+
+    def _edit_views(self, image: Image.Image, seed: int) -> list[Image.Image]:
+        """
+        Generate the complementary views in a single diffusion batch on the edit stream.
+        """
+        with torch.cuda.stream(self._edit_stream):
+            return self.qwen_edit.edit_image_batch(
+                prompt_image=image,
+                seed=seed,
+                prompts=list(self.VIEW_PROMPTS),
+            )
+
+    def _prompt_removes_background(self, prompt: str) -> bool:
+        """
+        Check if the edit prompt asks Qwen-Edit to replace the background.
+        """
+        if not self.settings.skip_rmbg_if_prompt_removes_bg:
+            return False
+
+        prompt = prompt.lower()
+        return "remove background" in prompt or "neutral solid color" in prompt
+
     def _enhance_image_quality(self, image: Image.Image) -> Image.Image:
         """
         Enhance image quality while preserving original features.
+
+        Equivalent to PIL MedianFilter(3) -> Sharpness(1.15) -> Contrast(1.1) -> Color(1.05),
+        with the three enhancers fused into a single float32 pass over the pixels.
+        Runs on the Qwen GPU when available, on the CPU otherwise, or through the
+        reference PIL chain with FAST_PREPROCESS=false.
         
         Args:
             image: Input PIL Image
@@ -85,147 +268,212 @@ class GenerationPipeline:
         Returns:
             Enhanced PIL Image
         """
-        from PIL import ImageEnhance, ImageFilter
-        
         # Convert to RGB if needed
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        
-        # 1. Mild denoising to reduce artifacts without losing detail
-        image = image.filter(ImageFilter.MedianFilter(size=3))
-        
-        # 2. Enhance sharpness slightly to preserve fine details
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(1.15)  # Mild sharpening
-        
-        # 3. Enhance contrast slightly for better feature definition
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(1.1)  # Mild contrast boost
-        
-        # 4. Enhance color saturation slightly (preserves original colors)
-        enhancer = ImageEnhance.Color(image)
-        image = enhancer.enhance(1.05)  # Very mild saturation boost
-        
+
+        if not self.settings.fast_preprocess:
+            image = self._enhance_with_pil(image)
+            logger.info(f"Enhanced image quality: {image.size}")
+            return image
+
+        rgb = np.asarray(image)
+        if torch.cuda.is_available():
+            try:
+                enhanced = self._enhance_on_gpu(rgb)
+            except Exception as e:
+                logger.warning(f"GPU image enhancement failed: {e}, falling back to CPU")
+                enhanced = self._enhance_on_cpu(rgb)
+        else:
+            enhanced = self._enhance_on_cpu(rgb)
+
+        image = Image.fromarray(enhanced)
+
         logger.info(f"Enhanced image quality: {image.size}")
         return image
+
+    def _enhance_with_pil(self, image: Image.Image, sharpness: float = 1.15, contrast: float = 1.1, color: float = 1.05) -> Image.Image:
+        """
+        Reference PIL implementation of _enhance_image_quality, one filter or enhancer pass at a time.
+        """
+        image = image.filter(ImageFilter.MedianFilter(size=3))
+        image = ImageEnhance.Sharpness(image).enhance(sharpness)
+        image = ImageEnhance.Contrast(image).enhance(contrast)
+        return ImageEnhance.Color(image).enhance(color)
+
+    def _enhance_on_cpu(self, rgb: np.ndarray, sharpness: float = 1.15, contrast: float = 1.1, color: float = 1.05) -> np.ndarray:
+        """
+        CPU (OpenCV / NumPy) implementation of _enhance_image_quality on an (H, W, 3) uint8 array.
+        """
+        # 1. Mild denoising to reduce artifacts without losing detail
+        denoised = cv2.medianBlur(rgb, 3)
+
+        # 2. Sharpness: blend with the PIL SMOOTH (3x3, center 5, /13) filtered image
+        smooth = cv2.filter2D(denoised, cv2.CV_32F, SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE)
+        sharpened = denoised.astype(np.float32)
+        sharpened *= sharpness
+        sharpened += (1 - sharpness) * smooth
+        np.clip(sharpened, 0, 255, out=sharpened)
+
+        # 3-4. Contrast (blend with mean luminance) followed by color (blend with luminance)
+        # collapse into: contrast * (color * x + (1 - color) * L(x)) + (1 - contrast) * mean(L(x))
+        luminance = sharpened @ LUMINANCE_WEIGHTS
+        mean_luminance = float(int(luminance.mean() + 0.5))
+        enhanced = sharpened
+        enhanced *= contrast * color
+        enhanced += (contrast * (1 - color)) * luminance[..., None]
+        enhanced += (1 - contrast) * mean_luminance
+        np.clip(enhanced, 0, 255, out=enhanced)
+
+        return np.rint(enhanced).astype(np.uint8)
+
+    @torch.no_grad()
+    def _enhance_on_gpu(self, rgb: np.ndarray, sharpness: float = 1.15, contrast: float = 1.1, color: float = 1.05) -> np.ndarray:
+        """
+        GPU (torch) implementation of _enhance_image_quality on an (H, W, 3) uint8 array, same math as the CPU one.
+        """
+        device = self.qwen_edit.device
+        height, width = rgb.shape[:2]
+
+        # (H, W, 3) uint8 -> (3, H, W), uploaded through the reused pinned staging buffer
+        if self._enhance_staging is None or self._enhance_staging.numel() < rgb.size:
+            self._enhance_staging = torch.empty(rgb.size, dtype=torch.uint8, pin_memory=True)
+        staging = self._enhance_staging[:rgb.size].view(rgb.shape)
+        staging.numpy()[...] = rgb
+        # Safe to reuse on the next call: the result is copied back to the host before returning
+        x = staging.to(device, non_blocking=True).permute(2, 0, 1)
+
+        # 1. 3x3 median with replicated borders (as cv2.medianBlur), through a min/max network on shifted views
+        rows = torch.arange(-1, height + 1, device=device).clamp_(0, height - 1)
+        cols = torch.arange(-1, width + 1, device=device).clamp_(0, width - 1)
+        padded = x.index_select(1, rows).index_select(2, cols)
+        values = [padded[:, dy:dy + height, dx:dx + width] for dy in range(3) for dx in range(3)]
+        for i, j in MEDIAN9_NETWORK:
+            values[i], values[j] = torch.minimum(values[i], values[j]), torch.maximum(values[i], values[j])
+        denoised = values[4].float().unsqueeze(0)
+
+        # 2. Sharpness: blend with the PIL SMOOTH filtered image
+        kernel = torch.from_numpy(SMOOTH_KERNEL).to(device).expand(3, 1, 3, 3).contiguous()
+        smooth = F.conv2d(F.pad(denoised, (1, 1, 1, 1), mode="replicate"), kernel, groups=3)
+        sharpened = (denoised * sharpness).add_(smooth, alpha=1 - sharpness).clamp_(0, 255)
+
+        # 3-4. Contrast and color collapsed into one expression, see _enhance_on_cpu
+        weights = torch.from_numpy(LUMINANCE_WEIGHTS).to(device).view(1, 3, 1, 1)
+        luminance = (sharpened * weights).sum(dim=1, keepdim=True)
+        mean_luminance = torch.floor(luminance.mean() + 0.5)
+        enhanced = sharpened.mul_(contrast * color)
+        enhanced.add_(luminance, alpha=contrast * (1 - color))
+        enhanced.add_(mean_luminance * (1 - contrast)).clamp_(0, 255)
+
+        return enhanced.round_().to(torch.uint8)[0].permute(1, 2, 0).contiguous().cpu().numpy()
     
-    def _calibrate_colors(self, original: Image.Image, edited: Image.Image) -> Image.Image:
+    @staticmethod
+    def _image_stats(*images: Image.Image, stddev: bool = True) -> tuple[np.ndarray, Optional[np.ndarray]]:
         """
-        Calibrate edited image colors to match original image.
+        Per-channel RGB means and standard deviations of each of the given images, with NumPy reductions.
+
+        Args:
+            images: Images of any size, alpha is ignored
+            stddev: Whether to compute the standard deviations, a second pass over the pixels
+
+        Returns:
+            (N, 3) means and (N, 3) standard deviations (None when not requested) as float32
+        """
+        # Reduced per image, the views are not always the same size (background removal falls back to the input)
+        pixels = [np.asarray(image)[..., :3].reshape(-1, 3) for image in images]
+        means = np.array([image_pixels.mean(axis=0, dtype=np.float64) for image_pixels in pixels], dtype=np.float32)
+        stddevs = np.array([image_pixels.std(axis=0, dtype=np.float64) for image_pixels in pixels], dtype=np.float32) if stddev else None
+        return means, stddevs
+
+    def _color_gains(self, original_mean: np.ndarray, edited: Image.Image) -> np.ndarray:
+        """
+        Compute the per-channel gains calibrating edited image colors to match the original image.
         This ensures exact color preservation across all generated views.
         
         Args:
-            original: Original input image (reference)
+            original_mean: RGB means of the original input image (reference)
             edited: Edited image that may have color drift
             
         Returns:
-            Color-calibrated image matching original
+            RGB gains, applied by _apply_gains
         """
-        from PIL import ImageStat
-        
         try:
-            # Get color statistics from both images
-            orig_stat = ImageStat.Stat(original)
-            edit_stat = ImageStat.Stat(edited)
+            # Get color statistics of the edited image
+            edit_mean = self._image_stats(edited, stddev=False)[0][0]
             
             # Calculate correction factors for each RGB channel
-            corrections = []
-            for i in range(3):  # RGB channels
-                if edit_stat.mean[i] > 0:
-                    correction = orig_stat.mean[i] / edit_stat.mean[i]
-                    # Limit correction to reasonable range to avoid artifacts
-                    correction = max(0.8, min(1.2, correction))
-                else:
-                    correction = 1.0
-                corrections.append(correction)
-            
-            # Apply color corrections
-            edited_array = np.array(edited).astype(float)
-            for i in range(3):  # RGB
-                edited_array[:,:,i] *= corrections[i]
-            
-            # Clip values to valid range
-            edited_array = np.clip(edited_array, 0, 255).astype(np.uint8)
-            calibrated = Image.fromarray(edited_array)
+            # Limit correction to reasonable range to avoid artifacts, black channels stay untouched
+            corrections = np.where(edit_mean > 0, np.clip(original_mean / np.maximum(edit_mean, 1e-6), 0.8, 1.2), 1.0).astype(np.float32)
             
-            logger.info(f"Color calibration applied - Corrections: R={corrections[0]:.3f}, G={corrections[1]:.3f}, B={corrections[2]:.3f}")
-            return calibrated
+            logger.info(f"Color calibration - Corrections: R={corrections[0]:.3f}, G={corrections[1]:.3f}, B={corrections[2]:.3f}")
+            return corrections
             
         except Exception as e:
             logger.warning(f"Color calibration failed: {e}, using original edited image")
-            return edited
+            return np.ones(3, dtype=np.float32)
     
-    def _normalize_lighting(self, images: list[Image.Image]) -> list[Image.Image]:
+    def _lighting_factors(self, view_means: np.ndarray) -> np.ndarray:
         """
-        Normalize lighting across all views for consistency.
+        Compute the brightness factors normalizing lighting across all views for consistency.
         This helps Trellis understand 3D structure better.
         
         Args:
-            images: List of images from different views
+            view_means: (N, 3) RGB means of the color calibrated views
             
         Returns:
-            List of lighting-normalized images
+            (N,) brightness factors, one per view
         """
-        from PIL import ImageStat, ImageEnhance
-        
         try:
             # Calculate brightness for each image (average of RGB channels)
-            brightness_values = []
-            for img in images:
-                stat = ImageStat.Stat(img)
-                avg_brightness = sum(stat.mean[:3]) / 3  # RGB average
-                brightness_values.append(avg_brightness)
+            brightness_values = view_means.mean(axis=1)
             
-            # Calculate target brightness (median to avoid outliers)
-            target_brightness = sorted(brightness_values)[len(brightness_values) // 2]
+            # Calculate target brightness (upper median to avoid outliers)
+            target_brightness = np.sort(brightness_values)[len(brightness_values) // 2]
             
-            # Normalize each image
-            normalized = []
-            for img, current_brightness in zip(images, brightness_values):
-                if current_brightness > 0:
-                    factor = target_brightness / current_brightness
-                    # Limit adjustment to avoid overexposure/underexposure
-                    factor = max(0.8, min(1.2, factor))
-                    
-                    enhancer = ImageEnhance.Brightness(img)
-                    normalized_img = enhancer.enhance(factor)
-                    normalized.append(normalized_img)
-                else:
-                    normalized.append(img)
+            # Limit adjustment to avoid overexposure/underexposure, black views stay untouched
+            factors = np.where(
+                brightness_values > 0,
+                np.clip(target_brightness / np.maximum(brightness_values, 1e-6), 0.8, 1.2),
+                1.0,
+            ).astype(np.float32)
             
-            logger.info(f"Lighting normalization applied - Target brightness: {target_brightness:.1f}")
-            return normalized
+            logger.info(f"Lighting normalization - Target brightness: {target_brightness:.1f}")
+            return factors
             
         except Exception as e:
             logger.warning(f"Lighting normalization failed: {e}, using original images")
-            return images
+            return np.ones(len(view_means), dtype=np.float32)
+
+    def _apply_gains(self, image: Image.Image, gains: np.ndarray) -> Image.Image:
+        """
+        Scale the RGB channels of the image in a single saturating uint8 pass.
+        Fuses the color calibration and the lighting normalization, PIL Brightness is a plain scale as well.
+        """
+        if np.allclose(gains, 1.0):
+            return image
+
+        # cv2.transform multiplies each pixel by the diagonal matrix and saturates back to uint8
+        scaled = cv2.transform(np.asarray(image.convert("RGB")), np.diag(gains).astype(np.float32))
+        return Image.fromarray(scaled)
     
-    def _validate_view_consistency(self, views: list[Image.Image], original: Image.Image) -> bool:
+    def _validate_view_consistency(self, view_means: np.ndarray, view_stddevs: np.ndarray, original_mean: np.ndarray) -> bool:
         """
         Validate that generated views are consistent with each other and the original.
         Checks color consistency to ensure all views show the same object.
         
         Args:
-            views: List of generated view images
-            original: Original input image for reference
+            view_means: (N, 3) RGB means of the generated views
+            view_stddevs: (N,) red channel standard deviations of the generated views
+            original_mean: RGB means of the original input image for reference
             
         Returns:
             True if views are consistent, False otherwise
         """
-        from PIL import ImageStat
-        
         try:
-            # Get color statistics for all views
-            color_stats = [ImageStat.Stat(view) for view in views]
-            orig_stat = ImageStat.Stat(original)
-            
             # Check color consistency across views
             for channel in range(3):  # RGB channels
-                channel_values = [stat.mean[channel] for stat in color_stats]
-                original_value = orig_stat.mean[channel]
-                
                 # Calculate variance from original
-                max_diff = max(abs(val - original_value) for val in channel_values)
+                max_diff = float(np.abs(view_means[:, channel] - original_mean[channel]).max())
                 
                 # Threshold: views shouldn't differ from original by more than 50 units
                 if max_diff > 50:
@@ -233,8 +481,7 @@ class GenerationPipeline:
                     return False
             
             # Check contrast consistency
-            contrasts = [stat.stddev[0] if stat.stddev else 0 for stat in color_stats]
-            contrast_variance = max(contrasts) - min(contrasts)
+            contrast_variance = float(view_stddevs.max() - view_stddevs.min())
             
             if contrast_variance > 40:
                 logger.warning(f"High contrast variance: {contrast_variance:.1f}")
@@ -248,40 +495,47 @@ class GenerationPipeline:
             return True  # Don't block generation on validation failure
 
     async def warmup_generator(self) -> None:
-        """Function for warming up the generator"""
-
-        temp_image = Image.new("RGB", (64, 64), color=(128, 128, 128))
-        buffer = io.BytesIO()
-        temp_image.save(buffer, format="PNG")
-        temp_imge_bytes = buffer.getvalue()
-        await self.generate_from_upload(temp_imge_bytes, seed=42)
-
-    async def generate_from_upload(self, image_bytes: bytes, seed: int) -> bytes:
         """
-        Generate 3D model from uploaded image file and return PLY as bytes.
+        Function for warming up the generator.
+        Runs a full generation at the production input size, with an object on the image so that
+        background removal finds a foreground and Trellis samples a realistic number of voxels.
+        """
+        height, width = self.settings.warmup_image_size
+        temp_image = Image.new("RGB", (width, height), color=(235, 235, 235))
+        draw = ImageDraw.Draw(temp_image)
+        draw.ellipse((width // 4, height // 5, 3 * width // 4, 4 * height // 5), fill=(180, 60, 40), outline=(40, 40, 40), width=8)
+        draw.rectangle((2 * width // 5, height // 3, 3 * width // 5, 2 * height // 3), fill=(60, 90, 160))
+
+        await self.generate_gs_from_image(temp_image, seed=42)
+
+    async def generate_from_upload(
+        self,
+        image_bytes: bytes,
+        seed: int,
+        output_format: Literal["ply", "spz"] = "ply",
+    ) -> bytes:
+        """
+        Generate 3D model from uploaded image file and return PLY (or SPZ) as bytes.
 
         Args:
             image_bytes: Raw image bytes from uploaded file
+            output_format: Format of the returned model
 
         Returns:
-            PLY file as bytes
+            PLY or SPZ file as bytes
         """
-        # Encode to base64
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-        # Create request
-        request = GenerateRequest(
-            prompt_image=image_base64, prompt_type="image", seed=seed
-        )
+        # Open the uploaded bytes directly, no base64 round-trip needed
+        image = decode_image_bytes(image_bytes, self._draft_size)
 
         # Generate
-        response = await self.generate_gs(request)
+        response = await self.generate_gs_from_image(image, seed, output_format=output_format)
 
-        # Return binary PLY
-        if not response.ply_file_base64:
-            raise ValueError("PLY generation failed")
+        # Return binary PLY / SPZ
+        model_file = response.spz_file_base64 if output_format == "spz" else response.ply_file_base64
+        if not model_file:
+            raise ValueError(f"{output_format.upper()} generation failed")
 
-        return response.ply_file_base64  # bytes
+        return model_file  # bytes
 
     async def generate_gs(self, request: GenerateRequest) -> GenerateResponse:
         """
@@ -293,19 +547,60 @@ class GenerationPipeline:
         Returns:
             GenerateResponse with generated assets
         """
+        # Decode input image
+        image = decode_image(request.prompt_image, self._draft_size)
+
+        output_format = request.output_format or ("spz" if self.settings.compression else "ply")
+
+        response = await self.generate_gs_from_image(image, request.seed, request.trellis_params, output_format)
+
+        # Clients relying on COMPRESSION read the SPZ from ply_file_base64, spz_file_base64 is additive
+        if request.output_format is None and output_format == "spz":
+            response.ply_file_base64 = response.spz_file_base64
+        return response
+
+    async def generate_gs_from_image(
+        self,
+        image: Image.Image,
+        seed: int,
+        trellis_params: Optional[TrellisParamsOverrides] = None,
+        output_format: Literal["ply", "spz"] = "ply",
+    ) -> GenerateResponse:
+        """
+        Execute full generation pipeline on an already decoded image.
+
+        Args:
+            image: Input RGB image
+            seed: Generation seed, negative for a random one
+            trellis_params: Optional Trellis parameter overrides
+            output_format: Format of the generated model file
+
+        Returns:
+            GenerateResponse with generated assets
+        """
+        # The awaits below would otherwise let a second request run its Qwen edits during this one's
+        # Trellis pass and re-seed the global RNGs in between
+        async with self._generation_lock:
+            return await self._generate_gs_from_image(image, seed, trellis_params, output_format)
+
+    async def _generate_gs_from_image(
+        self,
+        image: Image.Image,
+        seed: int,
+        trellis_params: Optional[TrellisParamsOverrides],
+        output_format: Literal["ply", "spz"],
+    ) -> GenerateResponse:
+        """
+        Run the generation pipeline, only called with the generation lock held.
+        """
         t1 = time.time()
         logger.info(f"New generation request")
 
         # Set seed
-        if request.seed < 0:
-            request.seed = secure_randint(0, 10000)
-            set_random_seed(request.seed)
-        else:
-            set_random_seed(request.seed)
+        if seed < 0:
+            seed = secure_randint(0, 10000)
+        set_random_seed(seed)
 
-        # Decode input image
-        image = decode_image(request.prompt_image)
-        
         # Enhance the original image quality
         image_enhanced = self._enhance_image_quality(image)
         
@@ -315,51 +610,48 @@ class GenerationPipeline:
         if self.settings.use_original_as_primary:
             # Use the original (enhanced) image directly as the primary view
             logger.info("Using original image as primary view to preserve accuracy")
-            image_primary = self.qwen_edit.edit_image(
-                prompt_image=image_enhanced,
-                seed=request.seed,
-                prompt="Preserve exact colors, shapes, and all details. Only improve image quality and remove background with neutral solid color. Keep the same viewing angle",
-            )
-            image_without_background_primary = self.rmbg.remove_background(image_primary)
+            # The edit pipe is stateful (scheduler), so this edit cannot overlap with the view edits
+            with torch.cuda.stream(self._edit_stream):
+                image_edited_primary = self.qwen_edit.edit_image(
+                    prompt_image=image_enhanced,
+                    seed=seed,
+                    prompt=self.PRIMARY_VIEW_PROMPT,
+                )
+            cleaned_by_prompt = self._prompt_removes_background(self.PRIMARY_VIEW_PROMPT)
         else:
             # Legacy: edit the image
-            image_without_background_primary = self.rmbg.remove_background(image_enhanced)
-
-        # Generate complementary views with 3D rotation (around vertical Y-axis)
-        # Left three-quarters view - 45° rotation around vertical axis (Y-axis)
-        image_edited_left = self.qwen_edit.edit_image(
-            prompt_image=image,
-            seed=request.seed,
-            prompt="Rotate object 45 degrees counterclockwise around vertical axis (Y-axis) to show left three-quarter view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
-        )
-        # Apply color calibration to match original
-        image_edited_left = self._calibrate_colors(image, image_edited_left)
-        image_without_background_left = self.rmbg.remove_background(image_edited_left)
-
-        # Right three-quarters view - 45° rotation around vertical axis (Y-axis)
-        image_edited_right = self.qwen_edit.edit_image(
-            prompt_image=image,
-            seed=request.seed,
-            prompt="Rotate object 45 degrees clockwise around vertical axis (Y-axis) to show right three-quarter view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
-        )
-        # Apply color calibration to match original
-        image_edited_right = self._calibrate_colors(image, image_edited_right)
-        image_without_background_right = self.rmbg.remove_background(image_edited_right)
-
-        # Back view - 180° rotation around vertical axis (Y-axis)
-        image_edited_back = self.qwen_edit.edit_image(
-            prompt_image=image,
-            seed=request.seed,
-            prompt="Rotate object 180 degrees around vertical axis (Y-axis) to show back view. Preserve exact colors, textures, proportions, and all details. Clean neutral background. Maintain 3D depth and volume",
-        )
-        # Apply color calibration to match original
-        image_edited_back = self._calibrate_colors(image, image_edited_back)
-        image_without_background_back = self.rmbg.remove_background(image_edited_back)
-
-        trellis_result: Optional[TrellisResult] = None
-
-        # Resolve Trellis parameters from request
-        trellis_params: TrellisParams = request.trellis_params
+            image_edited_primary = image_enhanced
+            cleaned_by_prompt = False
+        del image_enhanced
+
+        image_without_background_primary: Optional[Image.Image] = None
+        if self.settings.rmbg_batch_all_views and not cleaned_by_prompt:
+            # The primary view joins the batched background removal of the edited views
+            images_edited = await asyncio.to_thread(self._edit_views, image, seed)
+        else:
+            # Remove the primary view background while the complementary views are edited
+            image_without_background_primary, images_edited = await asyncio.gather(
+                asyncio.to_thread(self._remove_primary_background, image_edited_primary, cleaned_by_prompt),
+                asyncio.to_thread(self._edit_views, image, seed),
+            )
+        image_edited_left, image_edited_right, image_edited_back = images_edited
+        # Color calibration to match original, applied after background removal together with lighting
+        original_mean = self._image_stats(image, stddev=False)[0][0]
+        color_gains = np.stack([np.ones(3, dtype=np.float32)] + [
+            self._color_gains(original_mean, image_edited) for image_edited in images_edited
+        ])
+        pending_views = [image_edited_left, image_edited_right, image_edited_back]
+        if image_without_background_primary is None:
+            pending_views.insert(0, image_edited_primary)
+        images_without_background = await asyncio.to_thread(self._remove_views_background, pending_views)
+        if image_without_background_primary is None:
+            image_without_background_primary = images_without_background.pop(0)
+        (
+            image_without_background_left,
+            image_without_background_right,
+            image_without_background_back,
+        ) = images_without_background
+        del images_edited, pending_views, images_without_background
 
         # Collect all views
         all_views = [
@@ -369,31 +661,28 @@ class GenerationPipeline:
             image_without_background_back,      # Back view
         ]
         
-        # Quick Win #3: Validate view consistency
-        if not self._validate_view_consistency(all_views, image):
-            logger.warning("View consistency check failed - colors may not match perfectly")
-            # Continue anyway, but log the warning
-        
-        # Quick Win #2: Normalize lighting across all views
-        all_views_normalized = self._normalize_lighting(all_views)
-
-        # 3. Generate the 3D model with multiple views
-        # Order: Primary (front) -> Left -> Right -> Back
-        # Primary view has most weight in reconstruction
-        trellis_result = self.trellis.generate(
-            TrellisRequest(
-                images=all_views_normalized,
-                seed=request.seed,
-                params=trellis_params,
-            )
-        )
-
-        # Save generated files
+        # Scan every view once, the calibrated statistics follow from the gains since they are plain scales
+        view_means, view_stddevs = self._image_stats(*all_views, stddev=self.settings.validate_views)
+        calibrated_means = view_means * color_gains
+
+        # Quick Win #3: Validate view consistency, advisory only so it is opt-in
+        if self.settings.validate_views:
+            calibrated_stddevs = view_stddevs[:, 0] * color_gains[:, 0]
+            if not self._validate_view_consistency(calibrated_means, calibrated_stddevs, original_mean):
+                logger.warning("View consistency check failed - colors may not match perfectly")
+                # Continue anyway, but log the warning
+
+        # Quick Win #2: Normalize lighting across all views, in the same pass as the color calibration
+        lighting_factors = self._lighting_factors(calibrated_means)
+        view_gains = color_gains * lighting_factors[:, None]
+        all_views_normalized = [self._apply_gains(view, gains) for view, gains in zip(all_views, view_gains)]
+
+        # Save generated images on the save workers while Trellis runs, the model file follows once generated
         if self.settings.save_generated_files:
             save_files(
-                trellis_result, 
-                image, 
-                image_primary if self.settings.use_original_as_primary else image_enhanced,
+                None,
+                image,
+                image_edited_primary,
                 image_without_background_primary,
                 image_edited_left,
                 image_without_background_left,
@@ -401,25 +690,69 @@ class GenerationPipeline:
                 image_without_background_right,
                 image_edited_back,
                 image_without_background_back,
+                executor=self._save_executor,
             )
 
-        # Convert to PNG base64 for response (only if needed)
+        # Encode to base64 (RESPONSE_IMAGE_FORMAT) for response (only if needed), encoding both images in worker threads during Trellis
+        response_images = None
+        if self.settings.send_generated_files:
+            response_images = asyncio.gather(
+                asyncio.to_thread(to_b64, image_edited_primary, self.settings.response_image_format),
+                asyncio.to_thread(to_b64, image_without_background_primary, self.settings.response_image_format),
+            )
+
+        # Only the normalized views are needed from here on, drop the intermediates before the Trellis peak
+        del (
+            image_edited_primary,
+            image_edited_left,
+            image_edited_right,
+            image_edited_back,
+            image_without_background_primary,
+            image_without_background_left,
+            image_without_background_right,
+            image_without_background_back,
+            all_views,
+        )
+
+        # 3. Generate the 3D model with multiple views
+        # Order: Primary (front) -> Left -> Right -> Back
+        # Primary view has most weight in reconstruction
+        try:
+            trellis_result = await asyncio.to_thread(
+                self.trellis.generate,
+                TrellisRequest(
+                    images=all_views_normalized,
+                    seed=seed,
+                    params=trellis_params,
+                    format=output_format,
+                ),
+            )
+        except BaseException:
+            # Nobody awaits the response images anymore, retrieve their outcome so errors are not left unobserved
+            if response_images is not None:
+                response_images.cancel()
+                await asyncio.gather(response_images, return_exceptions=True)
+            raise
+        del all_views_normalized
+
+        if self.settings.save_generated_files:
+            self._save_executor.submit(save_trellis_result, trellis_result)
+
         image_edited_base64 = None
         image_without_background_base64 = None
-        if self.settings.send_generated_files:
-            image_edited_base64 = to_png_base64(image_primary if self.settings.use_original_as_primary else image_enhanced)
-            image_without_background_base64 = to_png_base64(image_without_background_primary)
+        if response_images is not None:
+            image_edited_base64, image_without_background_base64 = await response_images
 
         t2 = time.time()
         generation_time = t2 - t1
 
         logger.info(f"Total generation time: {generation_time} seconds")
-        # Clean the GPU memory
-        self._clean_gpu_memory()
+        self._debug_gpu_memory()
 
         response = GenerateResponse(
             generation_time=generation_time,
             ply_file_base64=trellis_result.ply_file if trellis_result else None,
+            spz_file_base64=trellis_result.spz_file if trellis_result else None,
             image_edited_file_base64=image_edited_base64
             if self.settings.send_generated_files
             else None,
@@ -1,11 +1,17 @@
 from PIL import Image
 
 import io
-import base64
+try:
+    # SIMD base64, a drop-in replacement for the stdlib module on the multi-MB image payloads
+    import pybase64 as base64
+except ImportError:
+    import base64
+from concurrent.futures import Executor
 from datetime import datetime
 from typing import Optional
-import os
 import random
+import secrets
+import threading
 import numpy as np
 import torch
 
@@ -14,57 +20,113 @@ from schemas.trellis_schemas import TrellisResult
 
 from config import settings
 
-def secure_randint(low: int, high: int) -> int:
-    """ Return a random integer in [low, high] using os.urandom. """
-    range_size = high - low + 1
-    num_bytes = 4
-    max_int = 2**(8 * num_bytes) - 1
+def resolve_dtype(dtype: str) -> torch.dtype:
+    """ Map a dtype name to the torch dtype, half precision falls back to float32 without CUDA. """
+    mapping = {
+        "bf16": torch.bfloat16,
+        "bfloat16": torch.bfloat16,
+        "fp16": torch.float16,
+        "float16": torch.float16,
+        "fp32": torch.float32,
+        "float32": torch.float32,
+    }
+    resolved = mapping.get(dtype.lower(), torch.bfloat16)
+    if not torch.cuda.is_available() and resolved in {torch.float16, torch.bfloat16}:
+        return torch.float32
+    return resolved
 
-    while True:
-        rand_bytes = os.urandom(num_bytes)
-        rand_int = int.from_bytes(rand_bytes, 'big')
-        if rand_int <= max_int - (max_int % range_size):
-            return low + (rand_int % range_size)
+def secure_randint(low: int, high: int) -> int:
+    """ Return a random integer in [low, high] from the OS CSPRNG. """
+    return low + secrets.randbelow(high - low + 1)
 
 def set_random_seed(seed: int) -> None:
     """ Function for setting global seed. """
     random.seed(seed)
     np.random.seed(seed)
+    # Also seeds every CUDA device (lazily, if CUDA is not initialized yet)
     torch.manual_seed(seed)
-    torch.cuda.manual_seed(seed)
-    torch.cuda.manual_seed_all(seed)
-    torch.backends.cudnn.deterministic = True
-    torch.backends.cudnn.benchmark = False
 
-def decode_image(prompt: str) -> Image.Image:
+def decode_image(prompt: str, draft_size: Optional[tuple[int, int]] = None) -> Image.Image:
     """
     Decode the image from the base64 string.
 
     Args:
         prompt: The base64 string of the image.
+        draft_size: Optional (width, height) the image will be downscaled to, see decode_image_bytes.
 
     Returns:
         The image.
     """
     # Decode the image from the base64 string
-    image_bytes = base64.b64decode(prompt)
-    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return decode_image_bytes(base64.b64decode(prompt), draft_size)
 
-def to_png_base64(image: Image.Image) -> str:
+def decode_image_bytes(raw: bytes, draft_size: Optional[tuple[int, int]] = None) -> Image.Image:
     """
-    Convert the image to PNG format and encode to base64.
+    Decode the image from raw encoded (PNG, JPEG, ...) bytes.
+
+    Args:
+        raw: The encoded image bytes.
+        draft_size: Optional (width, height) the image will be downscaled to anyway. JPEGs larger than
+            twice that size are then decoded at a reduced scale by libjpeg, never below draft_size.
+
+    Returns:
+        The RGB image.
+    """
+    image = Image.open(io.BytesIO(raw))
+    if draft_size is not None:
+        image.draft("RGB", draft_size)
+
+    # JPEGs decode straight to RGB, only convert the other modes
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    image.load()
+    return image
+
+def encode_base64(data: bytes) -> str:
+    """
+    Encode binary data to a base64 string.
+
+    Args:
+        data: The data to encode.
+
+    Returns:
+        Base64 encoded string.
+    """
+    # memoryview avoids copying the input, base64 output is pure ASCII
+    return base64.b64encode(memoryview(data)).decode("ascii")
+
+# Per-thread encode buffer reused by to_b64, since the response images are encoded concurrently
+_encode_local = threading.local()
+
+# Fast encoder options per response image format
+IMAGE_ENCODE_OPTIONS = {
+    "PNG": dict(compress_level=1, optimize=False),
+    "WEBP": dict(lossless=True, method=0),
+    "JPEG": dict(quality=90),
+}
+
+def to_b64(image: Image.Image, format: str = "PNG", **options) -> str:
+    """
+    Encode the image in the given format and then to base64.
 
     Args:
         image: The image to convert.
+        format: The image format (PNG, WEBP or JPEG).
+        options: Encoder options, overriding the fast defaults of the format.
 
     Returns:
-        Base64 encoded PNG image.
+        Base64 encoded image.
     """
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
+    buffer = getattr(_encode_local, "buffer", None)
+    if buffer is None:
+        buffer = _encode_local.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    image.save(buffer, format=format, **{**IMAGE_ENCODE_OPTIONS.get(format, {}), **options})
 
-    # Convert to base64 from bytes to string
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    # Convert to base64 straight from the buffer memory, the view is released before the next reuse
+    with buffer.getbuffer() as view:
+        return base64.b64encode(view).decode("ascii")
 
 def save_file_bytes(data: bytes, folder: str, prefix: str, suffix: str) -> None:
     """
@@ -100,7 +162,8 @@ def save_image(image: Image.Image, folder: str, prefix: str, timestamp: str) ->
     target_dir.mkdir(parents=True, exist_ok=True)
     path = target_dir / f"{prefix}.png"
     try:
-        image.save(path, format="PNG")
+        # Fast zlib level, these are debug artifacts
+        image.save(path, format="PNG", compress_level=1)
         logger.debug(f"Saved image {path}")
     except Exception as exc:
         logger.error(f"Failed to save image {path}: {exc}")
@@ -108,12 +171,15 @@ def save_image(image: Image.Image, folder: str, prefix: str, timestamp: str) ->
 def save_files(
     trellis_result: Optional[TrellisResult], 
     input_image: Image.Image,
+    image_primary: Image.Image,
+    image_without_background_primary: Image.Image,
     image_edited_1: Image.Image, 
     image_without_background_1: Image.Image,
     image_edited_2: Image.Image,
     image_without_background_2: Image.Image,
     image_edited_3: Image.Image,
-    image_without_background_3: Image.Image
+    image_without_background_3: Image.Image,
+    executor: Optional[Executor] = None,
 ) -> None:
     """
     Save the generated files to the output directory.
@@ -121,20 +187,46 @@ def save_files(
     Args:
         trellis_result: The Trellis result to save.
         input_image: The original input image.
+        image_primary: The primary (front) view.
+        image_without_background_primary: The primary view without background.
         image_edited_1: The first edited image (left view).
         image_without_background_1: The first image without background.
         image_edited_2: The second edited image (right view).
         image_without_background_2: The second image without background.
         image_edited_3: The third edited image (back view).
         image_without_background_3: The third image without background.
+        executor: Optional executor to submit each file save to, returning immediately. Saves inline otherwise.
     """
+    def run(func, *args) -> None:
+        if executor is not None:
+            executor.submit(func, *args)
+        else:
+            func(*args)
+
     # Save all images using PIL Image.save() with timestamp
     timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
-    save_image(input_image, "png", "input_original", timestamp)
-    save_image(image_edited_1, "png", "image_edited_left_view", timestamp)
-    save_image(image_without_background_1, "png", "image_no_bg_left_view", timestamp)
-    save_image(image_edited_2, "png", "image_edited_right_view", timestamp)
-    save_image(image_without_background_2, "png", "image_no_bg_right_view", timestamp)
-    save_image(image_edited_3, "png", "image_edited_back_view", timestamp)
-    save_image(image_without_background_3, "png", "image_no_bg_back_view", timestamp)
+    run(save_image, input_image, "png", "input_original", timestamp)
+    run(save_image, image_primary, "png", "image_primary_view", timestamp)
+    run(save_image, image_without_background_primary, "png", "image_no_bg_primary_view", timestamp)
+    run(save_image, image_edited_1, "png", "image_edited_left_view", timestamp)
+    run(save_image, image_without_background_1, "png", "image_no_bg_left_view", timestamp)
+    run(save_image, image_edited_2, "png", "image_edited_right_view", timestamp)
+    run(save_image, image_without_background_2, "png", "image_no_bg_right_view", timestamp)
+    run(save_image, image_edited_3, "png", "image_edited_back_view", timestamp)
+    run(save_image, image_without_background_3, "png", "image_no_bg_back_view", timestamp)
+
+    if trellis_result:
+        run(save_trellis_result, trellis_result)
+
+def save_trellis_result(trellis_result: TrellisResult) -> None:
+    """
+    Save the generated model files to the output directory.
+
+    Args:
+        trellis_result: The Trellis result to save.
+    """
+    if trellis_result.ply_file:
+        save_file_bytes(trellis_result.ply_file, "ply", "mesh", ".ply")
+    if trellis_result.spz_file:
+        save_file_bytes(trellis_result.spz_file, "spz", "mesh", ".spz")
 
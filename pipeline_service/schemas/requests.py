@@ -12,6 +12,9 @@ class GenerateRequest(BaseModel):
     prompt_image: str 
     seed: int = -1
 
+    # Output format, defaults to SPZ when compression is enabled in settings
+    output_format: Optional[Literal["ply", "spz"]] = None
+
     # Trellis parameters
     trellis_params: Optional[TrellisParamsOverrides] = None
     
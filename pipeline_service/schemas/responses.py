@@ -6,6 +6,7 @@ from pydantic import BaseModel
 class GenerateResponse(BaseModel):
     generation_time: float 
     ply_file_base64: Optional[str | bytes] = None
+    spz_file_base64: Optional[str | bytes] = None
     image_edited_file_base64: Optional[str] = None
     image_without_background_file_base64: Optional[str] = None
 
@@ -14,6 +15,7 @@ class GenerateResponse(BaseModel):
             "example": {
                 "generation_time": 7.2,
                 "ply_file_base64": "base64_encoded_ply_file",
+                "spz_file_base64": None,
                 "image_edited_file_base64": "base64_encoded_image_edited_file",
                 "image_without_background_file_base64": "base64_encoded_image_without_background_file",
             }
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional, TypeAlias
+from typing import Literal, Optional, TypeAlias
 from PIL import Image
 
 from schemas.overridable import OverridableModel
@@ -32,11 +32,13 @@ class TrellisRequest:
     images: list[Image.Image]
     seed: int
     params: Optional[TrellisParamsOverrides] = None
+    format: Literal["ply", "spz"] = "ply"
 
 
 @dataclass(slots=True)
 class TrellisResult:
     """Result from Trellis 3D generation."""
     ply_file: bytes | None = None
+    spz_file: bytes | None = None
 
 
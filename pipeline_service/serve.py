@@ -3,18 +3,17 @@ from __future__ import annotations
 from contextlib import asynccontextmanager
 from io import BytesIO
 from typing import AsyncGenerator
-import base64
+import asyncio
 
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 
-import pyspz
-
 from config import settings
 from logger_config import logger
 from schemas import GenerateRequest, GenerateResponse
 from modules import GenerationPipeline
+from modules.utils import encode_base64
 
 
 pipeline = GenerationPipeline(settings)
@@ -59,14 +58,15 @@ async def generate_from_base64(request: GenerateRequest) -> GenerateResponse:
     try:
         result = await pipeline.generate_gs(request)
 
-        compressed_ply_bytes = None
-
-        # compress the ply file 
-        if result.ply_file_base64 and settings.compression:
-            compressed_ply_bytes = pyspz.compress(result.ply_file_base64, workers=1) # returns bytes
-            logger.info(f"Compressed PLY size: {len(compressed_ply_bytes)} bytes")
-        
-        result.ply_file_base64 = base64.b64encode(result.ply_file_base64 if not compressed_ply_bytes else compressed_ply_bytes).decode("utf-8") # return bytes
+        # PLY or SPZ (when compression is requested) bytes -> base64, in a worker thread to keep the event loop free
+        # The SPZ fills both fields when COMPRESSION picked it, encode it once
+        shared_file = result.ply_file_base64 is not None and result.ply_file_base64 is result.spz_file_base64
+        if result.ply_file_base64:
+            result.ply_file_base64 = await asyncio.to_thread(encode_base64, result.ply_file_base64)
+        if shared_file:
+            result.spz_file_base64 = result.ply_file_base64
+        elif result.spz_file_base64:
+            result.spz_file_base64 = await asyncio.to_thread(encode_base64, result.spz_file_base64)
 
         return result
 
@@ -87,17 +87,16 @@ async def generate(prompt_image_file: UploadFile = File(...), seed: int = Form(-
         # Generate PLY from uploaded file
         ply_bytes = await pipeline.generate_from_upload(await prompt_image_file.read(), seed)
 
-        # Wrap bytes in BytesIO for streaming
-        ply_buffer = BytesIO(ply_bytes)
-        buffer_size = len(ply_buffer.getvalue())
-        ply_buffer.seek(0)
+        buffer_size = len(ply_bytes)
         logger.info(f"Task completed. PLY size: {buffer_size} bytes")
 
-        # Generate chunks of the ply file
-        async def generate_chunks()->AsyncGenerator[bytes, None]:
+        # Generate chunks of the ply file as zero-copy slices
+        ply_view = memoryview(ply_bytes)
+
+        async def generate_chunks()->AsyncGenerator[memoryview, None]:
             chunk_size = 1024 * 1024  # 1 MB
-            while chunk := ply_buffer.read(chunk_size):
-                yield chunk
+            for offset in range(0, buffer_size, chunk_size):
+                yield ply_view[offset:offset + chunk_size]
      
         return StreamingResponse(
             generate_chunks(),
@@ -119,17 +118,12 @@ async def generate(prompt_image_file: UploadFile = File(...), seed: int = Form(-
     try:
         logger.info(f"Task received (SPZ). Uploading image: {prompt_image_file.filename}")
         
-        # Generate PLY from uploaded file
-        ply_bytes = await pipeline.generate_from_upload(await prompt_image_file.read(), seed)
-
-        # Compress the ply file 
-        if ply_bytes:
-            # compress the ply file
-            ply_compressed_bytes = pyspz.compress(ply_bytes, workers=1) # return bytes
-            logger.info(f"Task completed. SPZ size: {len(ply_compressed_bytes)} bytes")
+        # Generate SPZ from uploaded file
+        spz_bytes = await pipeline.generate_from_upload(await prompt_image_file.read(), seed, output_format="spz")
+        logger.info(f"Task completed. SPZ size: {len(spz_bytes)} bytes")
 
         return StreamingResponse(
-            BytesIO(ply_compressed_bytes), 
+            BytesIO(spz_bytes), 
             media_type="application/octet-stream",
         )
 
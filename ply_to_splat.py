@@ -0,0 +1,81 @@
+"""
+Convert a Gaussian splatting PLY to the packed .splat format
+32 bytes per gaussian (antimatter15/splat layout), sorted so the most visible gaussians come first
+and progressive viewers can start rendering before the whole file is downloaded.
+
+Layout per gaussian:
+    position  3 x float32
+    scale     3 x float32 (exp of the PLY log scales)
+    color     4 x uint8   (RGB from the DC spherical harmonics, alpha from the sigmoid opacity)
+    rotation  4 x uint8   (normalized quaternion, mapped from [-1, 1] to [0, 255])
+
+Usage:
+    python ply_to_splat.py <input_ply_path> [--output <splat_path>]
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+from plyfile import PlyData
+
+# Zeroth order spherical harmonics constant
+SH_C0 = 0.28209479177387814
+
+SPLAT_DTYPE = np.dtype([
+    ("position", "<f4", 3),
+    ("scale", "<f4", 3),
+    ("color", "u1", 4),
+    ("rotation", "u1", 4),
+])
+
+
+def ply_to_splat(ply_path: Path) -> np.ndarray:
+    """Pack the gaussians of a PLY into a structured array of SPLAT_DTYPE records."""
+    vertex = PlyData.read(str(ply_path))["vertex"]
+
+    def stack(*names: str) -> np.ndarray:
+        return np.stack([np.asarray(vertex[name], dtype=np.float32) for name in names], axis=1)
+
+    position = stack("x", "y", "z")
+    scale = np.exp(stack("scale_0", "scale_1", "scale_2"))
+    rgb = 0.5 + SH_C0 * stack("f_dc_0", "f_dc_1", "f_dc_2")
+    alpha = 1 / (1 + np.exp(-np.asarray(vertex["opacity"], dtype=np.float32)))
+    rotation = stack("rot_0", "rot_1", "rot_2", "rot_3")
+    rotation /= np.maximum(np.linalg.norm(rotation, axis=1, keepdims=True), 1e-12)
+
+    # Largest, most opaque gaussians first
+    order = np.argsort(-scale.prod(axis=1) * alpha)
+
+    splat = np.empty(len(order), dtype=SPLAT_DTYPE)
+    splat["position"] = position[order]
+    splat["scale"] = scale[order]
+    splat["color"] = np.clip(np.concatenate([rgb, alpha[:, None]], axis=1)[order] * 255, 0, 255).astype(np.uint8)
+    splat["rotation"] = np.clip(rotation[order] * 128 + 128, 0, 255).astype(np.uint8)
+    return splat
+
+
+def convert_ply_to_splat(ply_path: str | Path, splat_path: str | Path | None = None) -> Path:
+    """Convert a PLY file, the .splat is written next to it unless a path is given."""
+    ply_path = Path(ply_path)
+    splat_path = Path(splat_path) if splat_path else ply_path.with_suffix(".splat")
+    splat = ply_to_splat(ply_path)
+    splat_path.write_bytes(splat.tobytes())
+    print(f"Converted {len(splat)} gaussians: {ply_path} -> {splat_path}")
+    return splat_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a Gaussian splatting PLY to the packed .splat format"
+    )
+    parser.add_argument("input_ply", type=str, help="Path to the input PLY")
+    parser.add_argument("--output", type=str, default=None,
+                       help="Path of the .splat to write (default: next to the PLY)")
+
+    args = parser.parse_args()
+    convert_ply_to_splat(args.input_ply, args.output)
+
+
+if __name__ == "__main__":
+    main()
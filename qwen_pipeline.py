@@ -0,0 +1,391 @@
+"""
+Qwen-2511 image edit pipeline loading and batched editing
+Shared by standalone_qwen_test.py and qwen_server.py, independent from the pipeline service.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from functools import lru_cache
+from pathlib import Path
+from PIL import Image
+
+# torch, diffusers and safetensors are imported where they are used, so importing this module stays cheap
+
+
+# Pipelines already loaded in this process, keyed by the loading options
+_PIPELINE_CACHE: dict[tuple, QwenImageEditPlusPipeline] = {}
+
+# Transformers with the LoRA fused in, saved by the first run so later runs skip the shard loading and the LoRA merge
+FUSED_CACHE_DIR = Path(os.environ.get("QWEN_FUSED_CACHE_DIR", "~/.cache/qwen_fused")).expanduser()
+
+
+# Timestep / sigma tables already computed, keyed by the set_timesteps arguments
+_SIGMA_TABLES: dict[tuple, tuple[torch.Tensor, torch.Tensor, int]] = {}
+
+
+@lru_cache(maxsize=None)
+def cached_scheduler_class():
+    """Define the caching scheduler on first use, its base class comes from diffusers."""
+    import numpy as np
+    import torch
+    from diffusers import FlowMatchEulerDiscreteScheduler
+    from diffusers.schedulers.scheduling_flow_match_euler_discrete import FlowMatchEulerDiscreteSchedulerOutput
+
+    class CachedFlowMatchEulerDiscreteScheduler(FlowMatchEulerDiscreteScheduler):
+        """
+        Flow match Euler scheduler reusing the sigma table of a known schedule and stepping without Python branches.
+        Only the deterministic (non stochastic, no per token timesteps) sampling of this test is supported.
+        """
+
+        def set_timesteps(self, num_inference_steps=None, device=None, sigmas=None, mu=None, timesteps=None):
+            # The pipeline passes only the sigmas (retrieve_timesteps), precompute_sigmas the step count as well
+            if num_inference_steps is None and sigmas is not None:
+                num_inference_steps = len(sigmas)
+            elif num_inference_steps is None and timesteps is not None:
+                num_inference_steps = len(timesteps)
+            key = (
+                num_inference_steps,
+                None if sigmas is None else tuple(np.asarray(sigmas, dtype=np.float64).tolist()),
+                mu,
+                None if timesteps is None else tuple(np.asarray(timesteps, dtype=np.float64).tolist()),
+                str(device),
+            )
+            cached = _SIGMA_TABLES.get(key)
+            if cached is None:
+                super().set_timesteps(num_inference_steps=num_inference_steps, device=device, sigmas=sigmas, mu=mu, timesteps=timesteps)
+                _SIGMA_TABLES[key] = (self.timesteps, self.sigmas, self.num_inference_steps)
+                return
+
+            # The tables are never written in place, sharing them between runs is safe
+            self.timesteps, self.sigmas, self.num_inference_steps = cached
+            self._step_index = None
+            self._begin_index = None
+
+        def step(self, model_output, timestep, sample, generator=None, return_dict=True, **kwargs):
+            if self.step_index is None:
+                self._init_step_index(timestep)
+
+            sigma, sigma_next = self.sigmas[self.step_index], self.sigmas[self.step_index + 1]
+            prev_sample = (sample.to(torch.float32) + (sigma_next - sigma) * model_output).to(model_output.dtype)
+            self._step_index += 1
+
+            if not return_dict:
+                return (prev_sample,)
+            return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+    return CachedFlowMatchEulerDiscreteScheduler
+
+
+def precompute_sigmas(scheduler, num_inference_steps=4, height=1024, width=1024, device="cuda:0") -> None:
+    """Compute the sigma table the pipeline will request for this resolution, the same way it does."""
+    import numpy as np
+    from diffusers.pipelines.qwenimage.pipeline_qwenimage_edit_plus import calculate_shift
+
+    image_seq_len = (height // 16) * (width // 16)
+    mu = calculate_shift(
+        image_seq_len,
+        scheduler.config.get("base_image_seq_len", 256),
+        scheduler.config.get("max_image_seq_len", 4096),
+        scheduler.config.get("base_shift", 0.5),
+        scheduler.config.get("max_shift", 1.15),
+    )
+    sigmas = np.linspace(1.0, 1 / num_inference_steps, num_inference_steps)
+    scheduler.set_timesteps(num_inference_steps=num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+
+
+def load_fused_transformer(model_path: str, fused_path: Path, dtype: torch.dtype) -> QwenImageTransformer2DModel:
+    """
+    Build the transformer with its parameters on the meta device and assign the cached fused weights straight into it.
+    Only the parameters are left empty, the tensors built in __init__ outside the state dict (the RoPE frequencies) stay real.
+    """
+    from accelerate import init_empty_weights
+    from safetensors.torch import load_file
+    from diffusers.models import QwenImageTransformer2DModel
+
+    config = QwenImageTransformer2DModel.load_config(model_path, subfolder="transformer")
+    with init_empty_weights():
+        transformer = QwenImageTransformer2DModel.from_config(config)
+    transformer.load_state_dict(load_file(str(fused_path)), assign=True)
+    return transformer.to(dtype)
+
+
+# Linear layers kept in bf16 under FP8, quantizing the second image MLP projection gives dark and blurry edits
+FP8_BF16_FALLBACK = ("img_mlp.net.2",)
+
+
+def quantize_transformer_fp8(transformer, dtype: torch.dtype, device="cuda:0") -> bool:
+    """
+    Quantize the transformer block linears to FP8 when the target device has FP8 tensor cores (Ada / Hopper).
+    Uses torchao's dynamic FP8 GEMMs when installed, otherwise only stores the weights in FP8.
+    """
+    import torch
+
+    device = torch.device(device)
+    if device.type != "cuda" or not torch.cuda.is_available() or torch.cuda.get_device_capability(device) < (8, 9):
+        print("FP8 needs compute capability 8.9+, keeping bf16 weights")
+        return False
+
+    try:
+        from torchao.quantization import quantize_, float8_dynamic_activation_float8_weight
+
+        def is_quantized(module, fqn):
+            return (
+                isinstance(module, torch.nn.Linear)
+                and fqn.startswith("transformer_blocks.")
+                and not fqn.endswith(FP8_BF16_FALLBACK)
+            )
+
+        quantize_(transformer, float8_dynamic_activation_float8_weight(), filter_fn=is_quantized)
+        print("Quantized transformer blocks to FP8 (torchao)")
+    except ImportError:
+        # Halves the weight memory and bandwidth, the matmuls still run in bf16
+        transformer.enable_layerwise_casting(
+            storage_dtype=torch.float8_e4m3fn,
+            compute_dtype=dtype,
+            skip_modules_pattern=("pos_embed", "patch_embed", "norm", "^proj_in$", "^proj_out$", *FP8_BF16_FALLBACK),
+        )
+        print("torchao not installed, storing transformer weights in FP8 with bf16 compute")
+    return True
+
+
+def fuse_qkv(pipeline) -> None:
+    """Fuse the q/k/v projections of the transformer and VAE attention blocks into one GEMM where supported."""
+    for name in ("transformer", "vae"):
+        model = getattr(pipeline, name, None)
+        if not hasattr(model, "fuse_qkv_projections"):
+            print(f"{name} has no fused QKV projections, skipping")
+            continue
+        try:
+            model.fuse_qkv_projections()
+            print(f"Fused {name} QKV projections")
+        except Exception as e:
+            print(f"Failed to fuse {name} QKV projections: {e}")
+
+
+def configure_vae(pipeline, channels_last=True, tiling=False) -> None:
+    """Run the VAE convolutions in the NDHWC layout and optionally decode in tiles to cap the peak VRAM."""
+    import torch
+
+    # Input shapes are fixed across the test cases, let cuDNN pick the fastest VAE conv algorithms once
+    torch.backends.cudnn.benchmark = True
+
+    if channels_last:
+        # The Qwen VAE is a causal video VAE with Conv3d layers, so the 5D variant of channels_last applies.
+        # Only the 5D weights take it, the attention / resample Conv2d and RMS norm gammas are 4D
+        for module in pipeline.vae.modules():
+            if isinstance(module, torch.nn.Conv3d) and module.weight.dim() == 5:
+                module.weight.data = module.weight.data.contiguous(memory_format=torch.channels_last_3d)
+    if tiling:
+        pipeline.vae.enable_tiling()
+
+
+def configure_pipeline(pipeline, attention_backend=None, compile_mode=None):
+    """Enable TF32, the fused SDPA kernels and optionally torch.compile on the transformer."""
+    import torch
+
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cuda.enable_flash_sdp(True)
+    torch.backends.cuda.enable_mem_efficient_sdp(True)
+
+    # The Qwen transformer has its own attention processor, pick the kernel through the dispatcher instead of replacing it
+    if attention_backend:
+        try:
+            pipeline.transformer.set_attention_backend(attention_backend)
+            print(f"Attention backend: {attention_backend}")
+        except Exception as e:
+            print(f"Failed to set attention backend '{attention_backend}': {e}")
+
+    if compile_mode:
+        print(f"Compiling transformer (mode={compile_mode})...")
+        pipeline.transformer.compile(mode=compile_mode, fullgraph=False)
+
+
+def warmup_pipeline(pipeline, image: Image.Image, prompts: list[str], device="cuda:0") -> None:
+    """
+    Trigger compilation (and CUDA graph capture for reduce-overhead) before the timed edits.
+    Runs a full batched edit with the real image and prompts, so the batch size, condition image size and
+    padded prompt length match the following calls and the compiled graphs are reused instead of recompiled.
+    """
+    import torch
+
+    print(f"Warming up compiled transformer (batch={len(prompts)}, image={image.size})...")
+    generators = [torch.Generator(device=device) for _ in prompts]
+    edit_images_batch(pipeline, image, prompts, 0, generators, device)
+
+
+def move_to_device_pinned(pipeline, device="cuda:0") -> None:
+    """
+    Move the model components to the device from page-locked memory with asynchronous copies.
+    The copies are queued on the current stream, so the following CPU setup overlaps with them.
+    """
+    import torch
+
+    for component in pipeline.components.values():
+        if not isinstance(component, torch.nn.Module):
+            continue
+        for tensor in list(component.parameters()) + list(component.buffers()):
+            tensor.data = tensor.data.pin_memory()
+        component.to(device, non_blocking=True)
+
+
+def load_qwen_pipeline(device="cuda:0", dtype=None, use_fused_cache=True, attention_backend=None, compile_mode=None, fp8=False, fuse_projections=False, vae_tiling=False, pin_weights=False):
+    """Load Qwen-2511 model with 4-step Lightning LoRA, in bf16 unless another dtype is given."""
+    import torch
+    from safetensors.torch import save_file
+    from diffusers import QwenImageEditPlusPipeline
+    from diffusers.models import QwenImageTransformer2DModel
+
+    dtype = dtype or torch.bfloat16
+
+    # Model paths
+    model_path = "Qwen/Qwen-Image-Edit-2511"
+    lora_repo = "lightx2v/Qwen-Image-Edit-2511-Lightning"
+    lora_weights = "Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"
+
+    cache_key = (model_path, lora_weights, device, dtype, attention_backend, compile_mode, fp8, fuse_projections, vae_tiling, pin_weights)
+    if cache_key in _PIPELINE_CACHE:
+        print("Reusing loaded pipeline")
+        return _PIPELINE_CACHE[cache_key]
+
+    fused_path = FUSED_CACHE_DIR / f"{model_path.replace('/', '--')}--{Path(lora_weights).stem}.safetensors"
+    lora_fused = use_fused_cache and fused_path.exists()
+
+    # Load transformer
+    if lora_fused:
+        print(f"Loading Qwen-2511 transformer with fused LoRA from {fused_path}...")
+        transformer = load_fused_transformer(model_path, fused_path, dtype)
+    else:
+        print("Loading Qwen-2511 transformer...")
+        transformer = QwenImageTransformer2DModel.from_pretrained(
+            model_path,
+            subfolder="transformer",
+            torch_dtype=dtype
+        )
+    
+    # Scheduler config (optimized for 4-step Lightning)
+    scheduler_config = {
+        "base_image_seq_len": 256,
+        "base_shift": math.log(3),
+        "invert_sigmas": False,
+        "max_image_seq_len": 8192,
+        "max_shift": math.log(3),
+        "num_train_timesteps": 1000,
+        "shift": 1.0,
+        "shift_terminal": None,
+        "stochastic_sampling": False,
+        "time_shift_type": "exponential",
+        "use_beta_sigmas": False,
+        "use_dynamic_shifting": True,
+        "use_exponential_sigmas": False,
+        "use_karras_sigmas": False,
+    }
+    
+    scheduler = cached_scheduler_class().from_config(scheduler_config)
+    
+    print("Loading Qwen-2511 pipeline...")
+    pipeline = QwenImageEditPlusPipeline.from_pretrained(
+        model_path,
+        transformer=transformer,
+        scheduler=scheduler,
+        torch_dtype=dtype
+    )
+    
+    if not lora_fused:
+        print(f"Loading LoRA weights: {lora_weights}...")
+        pipeline.load_lora_weights(lora_repo, weight_name=lora_weights)
+
+        # Merge the LoRA into the base weights, which also drops the LoRA layers from every forward
+        pipeline.fuse_lora()
+        pipeline.unload_lora_weights()
+
+        if use_fused_cache:
+            print(f"Caching fused transformer to {fused_path}...")
+            fused_path.parent.mkdir(parents=True, exist_ok=True)
+            state_dict = {name: tensor.contiguous() for name, tensor in pipeline.transformer.state_dict().items()}
+            # Written next to the final path and renamed into place, an interrupted write must not leave a truncated cache
+            partial_path = fused_path.with_name(f"{fused_path.name}.{os.getpid()}.partial")
+            try:
+                save_file(state_dict, str(partial_path))
+                os.replace(partial_path, fused_path)
+            finally:
+                partial_path.unlink(missing_ok=True)
+    
+    print(f"Moving to {device}...")
+    if pin_weights and torch.cuda.is_available():
+        move_to_device_pinned(pipeline, device)
+    else:
+        pipeline = pipeline.to(device)
+    # The per-step tqdm updates are serialized CPU work between the denoising steps
+    pipeline.set_progress_bar_config(disable=True)
+    # Fuse before quantizing and compiling, so the FP8 conversion and Inductor see the fused projections
+    if fuse_projections:
+        fuse_qkv(pipeline)
+    if fp8:
+        quantize_transformer_fp8(pipeline.transformer, dtype, device)
+    precompute_sigmas(pipeline.scheduler, device=device)
+    configure_vae(pipeline, tiling=vae_tiling)
+    configure_pipeline(pipeline, attention_backend, compile_mode)
+
+    # Make sure the asynchronous weight copies have landed before the first generation
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        if pin_weights:
+            # The pinned copies went back to the caching host allocator, release that page-locked RAM
+            torch._C._host_emptyCache()
+    
+    print("Pipeline ready!")
+    _PIPELINE_CACHE[cache_key] = pipeline
+    return pipeline
+
+
+def encode_prompts(pipeline, image: Image.Image, prompts: list[str], device="cuda:0"):
+    """
+    Encode each prompt against the condition image and zero-pad them into one batch.
+    The pipeline cannot tokenize a list of prompts for a single image, a list of images means several conditions.
+    """
+    import torch
+    import torch.nn.functional as F
+    from diffusers.pipelines.qwenimage.pipeline_qwenimage_edit_plus import CONDITION_IMAGE_SIZE, calculate_dimensions
+
+    width, height = calculate_dimensions(CONDITION_IMAGE_SIZE, image.width / image.height)
+    condition_image = pipeline.image_processor.resize(image, height, width)
+
+    embeds, masks = [], []
+    for prompt in prompts:
+        prompt_embeds, prompt_embeds_mask = pipeline.encode_prompt(prompt=prompt, image=[condition_image], device=device)
+        if prompt_embeds_mask is None:
+            prompt_embeds_mask = torch.ones(prompt_embeds.shape[:2], dtype=torch.long, device=prompt_embeds.device)
+        embeds.append(prompt_embeds[0])
+        masks.append(prompt_embeds_mask[0])
+
+    max_len = max(embed.shape[0] for embed in embeds)
+    prompt_embeds = torch.stack([F.pad(embed, (0, 0, 0, max_len - embed.shape[0])) for embed in embeds])
+    prompt_embeds_mask = torch.stack([F.pad(mask, (0, max_len - mask.shape[0])) for mask in masks])
+    return prompt_embeds, prompt_embeds_mask
+
+
+def edit_images_batch(pipeline, image: Image.Image, prompts: list[str], seed: int, generators: list[torch.Generator], device="cuda:0"):
+    """Edit the same image with several prompts in a single diffusion batch, one image per prompt."""
+    import torch
+
+    # One generator per batch item, each seeded like a single-image run so the views match the serial ones
+    for generator in generators:
+        generator.manual_seed(seed)
+
+    with torch.inference_mode():
+        prompt_embeds, prompt_embeds_mask = encode_prompts(pipeline, image, prompts, device)
+        result = pipeline(
+            image=image,
+            prompt_embeds=prompt_embeds,
+            prompt_embeds_mask=prompt_embeds_mask,
+            generator=generators,
+            num_inference_steps=4,
+            true_cfg_scale=1.0,
+            height=1024,
+            width=1024,
+        )
+
+    return result.images
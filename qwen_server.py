@@ -0,0 +1,160 @@
+"""
+Long-lived Qwen Image Edit server
+Loads the Qwen-2511 pipeline once and serves edits over HTTP, so the test scripts skip the model load on every run.
+
+Usage:
+    python qwen_server.py [--host <host>] [--port <int>] [--device <device>]
+
+Example:
+    python qwen_server.py --port 10007
+    python standalone_qwen_test.py cr7.png --server http://127.0.0.1:10007
+    python test_image_edit.py cr7.png --server http://127.0.0.1:10007
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+from contextlib import asynccontextmanager
+
+import requests
+import uvicorn
+from fastapi import FastAPI
+from PIL import Image
+from pydantic import BaseModel
+
+from qwen_pipeline import edit_images_batch, load_qwen_pipeline, warmup_pipeline
+
+
+DEFAULT_PORT = 10007
+
+# Compiled transformer warmup: the three views edited by the test scripts, with a prompt of their length
+WARMUP_BATCH = 3
+WARMUP_PROMPT = "Show this object in back view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details"
+
+# Loading options from the command line, the pipeline is loaded in the app lifespan
+load_options: dict = {"device": "cuda:0"}
+
+# Loaded pipeline, shared by every request
+pipeline = None
+
+# The GPU is single-tenant, edits run one at a time
+pipeline_lock = asyncio.Lock()
+
+
+class EditRequest(BaseModel):
+    image_b64: str
+    prompt: str
+    seed: int = 42
+
+
+class EditResponse(BaseModel):
+    image_b64: str
+
+
+class EditBatchRequest(BaseModel):
+    image_b64: str
+    prompts: list[str]
+    seed: int = 42
+
+
+class EditBatchResponse(BaseModel):
+    images_b64: list[str]
+
+
+def encode_image(image: Image.Image) -> str:
+    """Encode an image as base64 lossless WEBP."""
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", lossless=True, method=0, quality=100)
+    return base64.b64encode(buffer.getbuffer()).decode("ascii")
+
+
+def decode_image(image_b64: str) -> Image.Image:
+    """Decode a base64 image to RGB."""
+    return Image.open(io.BytesIO(base64.b64decode(image_b64))).convert("RGB")
+
+
+def edit_remote(server: str, image: Image.Image, prompts: list[str], seed: int, timeout: float = 600) -> list[Image.Image]:
+    """Edit the image with every prompt on a running server, in a single batch."""
+    response = requests.post(
+        f"{server.rstrip('/')}/edit_batch",
+        json={"image_b64": encode_image(image), "prompts": prompts, "seed": seed},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return [decode_image(image_b64) for image_b64 in response.json()["images_b64"]]
+
+
+async def run_edit(image_b64: str, prompts: list[str], seed: int) -> list[str]:
+    """Run a batched edit on the shared pipeline and encode the results."""
+    import torch
+
+    image = decode_image(image_b64)
+    device = load_options["device"]
+    generators = [torch.Generator(device=device) for _ in prompts]
+
+    async with pipeline_lock:
+        images = await asyncio.to_thread(edit_images_batch, pipeline, image, prompts, seed, generators, device)
+
+    return await asyncio.gather(*(asyncio.to_thread(encode_image, edited) for edited in images))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pipeline
+    loaded = await asyncio.to_thread(load_qwen_pipeline, **load_options)
+    if load_options.get("compile_mode"):
+        # Same batch as the test scripts send (one edit per view), other batch sizes and image sizes compile on first use
+        warmup_prompts = [WARMUP_PROMPT] * WARMUP_BATCH
+        await asyncio.to_thread(warmup_pipeline, loaded, Image.new("RGB", (1024, 1024)), warmup_prompts, load_options["device"])
+    pipeline = loaded
+    yield
+    pipeline = None
+
+
+app = FastAPI(title="Qwen Image Edit server", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health() -> dict:
+    return {"status": "ready" if pipeline is not None else "loading"}
+
+
+@app.post("/edit", response_model=EditResponse)
+async def edit(request: EditRequest) -> EditResponse:
+    images_b64 = await run_edit(request.image_b64, [request.prompt], request.seed)
+    return EditResponse(image_b64=images_b64[0])
+
+
+@app.post("/edit_batch", response_model=EditBatchResponse)
+async def edit_batch(request: EditBatchRequest) -> EditBatchResponse:
+    images_b64 = await run_edit(request.image_b64, request.prompts, request.seed)
+    return EditBatchResponse(images_b64=images_b64)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve Qwen-2511 image edits from a pipeline loaded once"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                       help="Host to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                       help=f"Port to bind (default: {DEFAULT_PORT})")
+    parser.add_argument("--device", type=str, default="cuda:0",
+                       help="Device to use (default: cuda:0)")
+    parser.add_argument("--compile-mode", type=str, default=None,
+                       choices=["default", "reduce-overhead", "max-autotune"],
+                       help="torch.compile the transformer with this mode (default: eager)")
+    parser.add_argument("--fp8", action="store_true",
+                       help="Quantize the transformer to FP8 on Ada / Hopper GPUs (default: bf16)")
+
+    args = parser.parse_args()
+
+    load_options.update(device=args.device, compile_mode=args.compile_mode, fp8=args.fp8)
+
+    # A single worker, every worker would load its own copy of the pipeline on the same GPU
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,104 +3,29 @@ Standalone Qwen Image Edit Test Script
 Completely independent from pipeline - loads model directly and tests editing capabilities.
 
 Usage:
-    python standalone_qwen_test.py <input_image_path> [--output-dir <dir>] [--seed <int>]
+    python standalone_qwen_test.py <input_image_path> [--output-dir <dir>] [--seed <int>] [--server <url>]
 
 Example:
     python standalone_qwen_test.py cr7.png --output-dir test_outputs --seed 42
 """
 
+from __future__ import annotations
+
 import argparse
-import math
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
-import torch
-from diffusers import QwenImageEditPlusPipeline, FlowMatchEulerDiscreteScheduler
-from diffusers.models import QwenImageTransformer2DModel
-
 
-def prepare_image(image: Image.Image, megapixels: float = 1.0) -> Image.Image:
-    """Resize image to target megapixels while maintaining aspect ratio."""
-    total = int(megapixels * 1024 * 1024)
-    scale_by = math.sqrt(total / (image.width * image.height))
-    width = round(image.width * scale_by)
-    height = round(image.height * scale_by)
-    return image.resize((width, height), Image.Resampling.LANCZOS)
+from qwen_pipeline import FUSED_CACHE_DIR, edit_images_batch, load_qwen_pipeline, warmup_pipeline
 
-
-def load_qwen_pipeline(device="cuda:0", dtype=torch.bfloat16):
-    """Load Qwen-2511 model with 4-step Lightning LoRA."""
-    print("Loading Qwen-2511 transformer...")
-    
-    # Model paths
-    model_path = "Qwen/Qwen-Image-Edit-2511"
-    lora_repo = "lightx2v/Qwen-Image-Edit-2511-Lightning"
-    lora_weights = "Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"
-    
-    # Load transformer
-    transformer = QwenImageTransformer2DModel.from_pretrained(
-        model_path,
-        subfolder="transformer",
-        torch_dtype=dtype
-    )
-    
-    # Scheduler config (optimized for 4-step Lightning)
-    scheduler_config = {
-        "base_image_seq_len": 256,
-        "base_shift": math.log(3),
-        "invert_sigmas": False,
-        "max_image_seq_len": 8192,
-        "max_shift": math.log(3),
-        "num_train_timesteps": 1000,
-        "shift": 1.0,
-        "shift_terminal": None,
-        "stochastic_sampling": False,
-        "time_shift_type": "exponential",
-        "use_beta_sigmas": False,
-        "use_dynamic_shifting": True,
-        "use_exponential_sigmas": False,
-        "use_karras_sigmas": False,
-    }
-    
-    scheduler = FlowMatchEulerDiscreteScheduler.from_config(scheduler_config)
-    
-    print("Loading Qwen-2511 pipeline...")
-    pipeline = QwenImageEditPlusPipeline.from_pretrained(
-        model_path,
-        transformer=transformer,
-        scheduler=scheduler,
-        torch_dtype=dtype
-    )
-    
-    print(f"Loading LoRA weights: {lora_weights}...")
-    pipeline.load_lora_weights(lora_repo, weight_name=lora_weights)
-    
-    print(f"Moving to {device}...")
-    pipeline = pipeline.to(device)
-    
-    print("Pipeline ready!")
-    return pipeline
+# torch is imported where it is used, so --help and argument errors return immediately
 
 
-def edit_image(pipeline, image: Image.Image, prompt: str, seed: int, device="cuda:0"):
-    """Edit image with Qwen pipeline."""
-    # Prepare image
-    prepared_image = prepare_image(image, megapixels=1.0)
-    
-    # Generate
-    generator = torch.Generator(device=device).manual_seed(seed)
-    
-    result = pipeline(
-        image=prepared_image,
-        prompt=prompt,
-        generator=generator,
-        num_inference_steps=4,
-        true_cfg_scale=1.0,
-        height=1024,
-        width=1024,
-    )
-    
-    return result.images[0]
+def save_image(image: Image.Image, path: Path, method: int = 0) -> None:
+    """Save a lossless WEBP (SIMD encoder, smaller and faster than PNG), run on the save workers."""
+    image.save(path, "WEBP", lossless=True, method=method, quality=100)
+    print(f"✓ Saved: {path}")
 
 
 def main():
@@ -114,6 +39,23 @@ def main():
                        help="Random seed (default: 42)")
     parser.add_argument("--device", type=str, default="cuda:0",
                        help="Device to use (default: cuda:0)")
+    parser.add_argument("--server", type=str, default=None,
+                       help="Send the edits to a running qwen_server.py instead of loading the pipeline (e.g. http://127.0.0.1:10007)")
+    parser.add_argument("--attention-backend", type=str, default=None,
+                       help="diffusers attention backend, e.g. flash or _flash_3 (default: native SDPA)")
+    parser.add_argument("--compile-mode", type=str, default=None,
+                       choices=["default", "reduce-overhead", "max-autotune"],
+                       help="torch.compile the transformer with this mode (default: eager)")
+    parser.add_argument("--fuse-qkv", action="store_true",
+                       help="Fuse the attention q/k/v projections into one GEMM where supported (default: off)")
+    parser.add_argument("--vae-tiling", action="store_true",
+                       help="Decode in tiles to cap the VAE peak VRAM for larger resolutions (default: off)")
+    parser.add_argument("--pin-weights", action="store_true",
+                       help="Upload the weights from pinned memory with non-blocking copies (default: off)")
+    parser.add_argument("--fp8", action="store_true",
+                       help="Quantize the transformer to FP8 on Ada / Hopper GPUs (default: bf16)")
+    parser.add_argument("--no-fused-cache", action="store_true",
+                       help=f"Do not read or write the fused transformer cache (default dir: {FUSED_CACHE_DIR})")
     
     args = parser.parse_args()
     
@@ -138,65 +80,93 @@ def main():
     print(f"Device: {args.device}")
     print(f"{'='*60}\n")
     
-    # Load pipeline
-    pipeline = load_qwen_pipeline(device=args.device)
+    # Load pipeline, unless a server already holds it
+    pipeline = None
+    if args.server:
+        print(f"Using Qwen server: {args.server}")
+    else:
+        pipeline = load_qwen_pipeline(
+            device=args.device,
+            use_fused_cache=not args.no_fused_cache,
+            attention_backend=args.attention_backend,
+            compile_mode=args.compile_mode,
+            fp8=args.fp8,
+            fuse_projections=args.fuse_qkv,
+            vae_tiling=args.vae_tiling,
+            pin_weights=args.pin_weights,
+        )
     
     # Load input image
     print(f"\nLoading input image...")
     input_image = Image.open(input_path).convert("RGB")
     print(f"Image size: {input_image.size}")
     
-    # Save original
-    input_output = output_path / "00_input_original.png"
-    input_image.save(input_output)
-    print(f"Saved: {input_output}")
+    # Save original on a worker thread while the views generate, with a tighter WEBP method since it is written only once
+    executor = ThreadPoolExecutor(max_workers=2)
+    executor.submit(save_image, input_image, output_path / "00_input_original.webp", 4)
     
     # Define test prompts
     test_cases = [
         {
             "name": "Left Three-Quarters View",
             "prompt": "Show this object in left three-quarters view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "01_edited_left_view.png"
+            "filename": "01_edited_left_view.webp"
         },
         {
             "name": "Right Three-Quarters View",
             "prompt": "Show this object in right three-quarters view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "02_edited_right_view.png"
+            "filename": "02_edited_right_view.webp"
         },
         {
             "name": "Back View",
             "prompt": "Show this object in back view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "03_edited_back_view.png"
+            "filename": "03_edited_back_view.webp"
         }
 
     ]
     
+    prompts = [test_case["prompt"] for test_case in test_cases]
+
+    # Create the generators once, every test case edits the same image
+    generators = []
+    if not args.server:
+        import torch
+        generators = [torch.Generator(device=args.device) for _ in test_cases]
+
+        # Compile with the shapes of the real batch, so the timed edits do not recompile
+        if args.compile_mode:
+            warmup_pipeline(pipeline, input_image, prompts, args.device)
+
     # Generate edited views
     print(f"\n{'='*60}")
     print(f"Generating {len(test_cases)} different views...")
     print(f"{'='*60}\n")
     
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"[{i}/{len(test_cases)}] {test_case['name']}")
-        
-        try:
-            edited_image = edit_image(
+    try:
+        if args.server:
+            from qwen_server import edit_remote
+            edited_images = edit_remote(args.server, input_image, prompts, args.seed)
+        else:
+            edited_images = edit_images_batch(
                 pipeline,
                 input_image,
-                test_case["prompt"],
+                prompts,
                 args.seed,
+                generators,
                 args.device
             )
-            
-            output_file = output_path / test_case["filename"]
-            edited_image.save(output_file)
-            print(f"✓ Saved: {output_file}\n")
-            
-        except Exception as e:
-            print(f"✗ Error: {e}\n")
-            continue
+    except Exception as e:
+        print(f"✗ Error: {e}\n")
+        edited_images = []
+
+    for i, (edited_image, test_case) in enumerate(zip(edited_images, test_cases), 1):
+        print(f"[{i}/{len(test_cases)}] {test_case['name']}")
+        executor.submit(save_image, edited_image, output_path / test_case["filename"])
+
+    # Wait for the pending saves
+    executor.shutdown(wait=True)
     
-    print(f"{'='*60}")
+    print(f"\n{'='*60}")
     print(f"Test completed!")
     print(f"All outputs: {output_path}")
     print(f"{'='*60}\n")
@@ -3,7 +3,7 @@ Standalone test script for Qwen Image Edit utility
 Tests the image editing capabilities by generating different views of an object.
 
 Usage:
-    python test_image_edit.py <input_image_path> [--output-dir <dir>] [--seed <int>]
+    python test_image_edit.py <input_image_path> [--output-dir <dir>] [--seed <int>] [--server <url>]
 
 Example:
     python test_image_edit.py input.png --output-dir test_outputs --seed 42
@@ -13,6 +13,7 @@ import asyncio
 import argparse
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
@@ -25,7 +26,6 @@ sys.path.insert(0, str(Path(__file__).parent / "pipeline_service"))
 
 # Import and configure settings without .env
 from config.settings import Settings
-from modules.image_edit.qwen_edit_module import QwenEditModule
 from logger_config import logger
 
 # Create minimal settings for testing
@@ -41,10 +41,18 @@ test_settings = Settings(
 )
 
 
+def save_image(image: Image.Image, path: Path, method: int = 0) -> None:
+    """Save a lossless WEBP (SIMD encoder, smaller and faster than PNG), run on the save workers."""
+    image.save(path, "WEBP", lossless=True, method=method, quality=100)
+    logger.success(f"Saved: {path}")
+
+
 async def test_image_edit(
     input_image_path: str,
     output_dir: str = "test_outputs",
-    seed: int = 42
+    seed: int = 42,
+    server: str = None,
+    force_shutdown: bool = False
 ):
     """
     Test Qwen Image Edit module with an input image.
@@ -53,6 +61,9 @@ async def test_image_edit(
         input_image_path: Path to the input image
         output_dir: Directory to save output images
         seed: Random seed for reproducibility
+        server: URL of a running qwen_server.py to send the edits to instead of loading the module.
+            The server runs the standalone qwen_pipeline, so this bypasses QwenEditModule's prompting and input resizing
+        force_shutdown: Release the shared module at the end instead of keeping it loaded for the next run
     """
     
     # Validate input image
@@ -69,75 +80,86 @@ async def test_image_edit(
     
     logger.info(f"Output directory: {output_path}")
     
-    # Initialize Qwen module
-    logger.info("Initializing Qwen Edit module...")
-    qwen = QwenEditModule(test_settings)
-    await qwen.startup()
+    # Initialize Qwen module, unless a server already holds the pipeline
+    qwen = None
+    if server:
+        logger.info(f"Using Qwen server: {server}")
+    else:
+        logger.info("Initializing Qwen Edit module...")
+        # Imported here, torch and diffusers would otherwise load before argparse even runs
+        from modules.image_edit.qwen_edit_module import QwenEditModule
+        qwen = QwenEditModule.get_or_create(test_settings)
+        await qwen.startup()
     
     # Load input image
     input_image = Image.open(input_path).convert("RGB")
     logger.info(f"Loaded input image: {input_image.size}")
     
-    # Save original input
-    input_output_path = output_path / "00_input_original.png"
-    input_image.save(input_output_path)
-    logger.success(f"Saved: {input_output_path}")
+    # Save original input on a worker thread while the views generate, with a tighter WEBP method since it is written only once
+    executor = ThreadPoolExecutor(max_workers=2)
+    executor.submit(save_image, input_image, output_path / "00_input_original.webp", 4)
     
     # Define test prompts for different views
     test_cases = [
         {
             "name": "left_three_quarters_view",
             "prompt": "Show this object in left three-quarters view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "01_edited_left_view.png"
+            "filename": "01_edited_left_view.webp"
         },
         {
             "name": "right_three_quarters_view",
             "prompt": "Show this object in right three-quarters view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "02_edited_right_view.png"
+            "filename": "02_edited_right_view.webp"
         },
         {
             "name": "back_view",
             "prompt": "Show this object in back view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "03_edited_back_view.png"
+            "filename": "03_edited_back_view.webp"
         },
         {
             "name": "front_view",
             "prompt": "Show this object in front view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "04_edited_front_view.png"
+            "filename": "04_edited_front_view.webp"
         },
         {
             "name": "top_view",
             "prompt": "Show this object in top view and make sure it is fully visible. Turn background neutral solid color contrasting with an object. Delete background details. Delete watermarks. Keep object colors. Sharpen image details",
-            "filename": "05_edited_top_view.png"
+            "filename": "05_edited_top_view.webp"
         }
     ]
     
     # Generate edited images for each view
     logger.info(f"\nGenerating {len(test_cases)} different views (seed={seed})...\n")
     
-    for i, test_case in enumerate(test_cases, 1):
-        logger.info(f"[{i}/{len(test_cases)}] Generating: {test_case['name']}")
-        logger.info(f"Prompt: {test_case['prompt'][:80]}...")
-        
-        try:
-            # Edit the image
-            edited_image = qwen.edit_image(
+    for test_case in test_cases:
+        logger.info(f"{test_case['name']}: {test_case['prompt'][:80]}...")
+
+    try:
+        # Edit the image with every prompt in one diffusion batch
+        prompts = [test_case["prompt"] for test_case in test_cases]
+        if server:
+            from qwen_server import edit_remote
+            edited_images = edit_remote(server, input_image, prompts, seed)
+        else:
+            edited_images = qwen.edit_image_batch(
                 prompt_image=input_image,
                 seed=seed,
-                prompt=test_case["prompt"]
+                prompts=prompts
             )
-            
-            # Save the result
-            output_file = output_path / test_case["filename"]
-            edited_image.save(output_file)
-            logger.success(f"Saved: {output_file}\n")
-            
-        except Exception as e:
-            logger.error(f"Error generating {test_case['name']}: {e}\n")
-            continue
+    except Exception as e:
+        logger.error(f"Error generating views: {e}\n")
+        edited_images = []
+
+    for edited_image, test_case in zip(edited_images, test_cases):
+        # Save the result
+        executor.submit(save_image, edited_image, output_path / test_case["filename"])
+
+    # Wait for the pending saves
+    executor.shutdown(wait=True)
     
-    # Shutdown
-    await qwen.shutdown()
+    # Keep the shared module loaded for later runs in this process unless asked to release it
+    if qwen is not None and force_shutdown:
+        await qwen.shutdown()
     
     logger.success(f"\n{'='*60}")
     logger.success(f"Test completed!")
@@ -166,6 +188,18 @@ def main():
         default=42,
         help="Random seed for reproducibility (default: 42)"
     )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help="Send the edits to a running qwen_server.py instead of loading the model (e.g. http://127.0.0.1:10007). "
+             "The server runs the standalone qwen_pipeline, so this bypasses QwenEditModule (its prompting and input resizing)"
+    )
+    parser.add_argument(
+        "--force-shutdown",
+        action="store_true",
+        help="Shut the Qwen module down at the end instead of keeping it loaded"
+    )
     
     args = parser.parse_args()
     
@@ -173,7 +207,9 @@ def main():
     asyncio.run(test_image_edit(
         input_image_path=args.input_image,
         output_dir=args.output_dir,
-        seed=args.seed
+        seed=args.seed,
+        server=args.server,
+        force_shutdown=args.force_shutdown
     ))
 
 
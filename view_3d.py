@@ -1,21 +1,45 @@
-import gradio as gr
 from argparse import ArgumentParser
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import FileResponse, HTMLResponse
+
+from ply_to_splat import convert_ply_to_splat
+
+VIEWER_HTML = Path(__file__).parent / "viewer.html"
 
 def parse_args():
     parser = ArgumentParser()
     parser.add_argument("--ply_file", type=str, required=True)
+    parser.add_argument("--keep_ply", action="store_true", help="Show the PLY as is instead of converting it to .splat")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7860)
     return parser.parse_args()
 
-def interactive_visualizer(ply_file):
-    with gr.Blocks() as demo:
-        gr.Markdown("# 3D Gaussian Splatting (black-screen loading might take a while)")
-        gr.Model3D(
-            value=ply_file,  # splat file
-            label="3D Scene",
-        )
-    demo.launch(share=True)
+def interactive_visualizer(scene_file, host="0.0.0.0", port=7860):
+    # Static three.js page loading the scene progressively, no Gradio app state or queue behind it
+    scene_file = Path(scene_file)
+    scene_format = "splat" if scene_file.suffix == ".splat" else "ply"
+    page = VIEWER_HTML.read_text().replace("{{SCENE_FORMAT}}", scene_format)
+
+    app = FastAPI(title="3D Gaussian Splatting viewer")
+
+    @app.get("/", response_class=HTMLResponse)
+    async def index():
+        return page
+
+    @app.get("/scene")
+    async def scene():
+        return FileResponse(scene_file, media_type="application/octet-stream")
+
+    print(f"Serving {scene_file} on http://{host}:{port}")
+    uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
     args = parse_args()
     ply_file = args.ply_file
-    interactive_visualizer(ply_file)
\ No newline at end of file
+    # The packed .splat is a fraction of the PLY bytes and ordered by visibility, so it renders sooner
+    if not args.keep_ply and ply_file.endswith(".ply"):
+        ply_file = str(convert_ply_to_splat(ply_file))
+    interactive_visualizer(ply_file, args.host, args.port)